@@ -3,7 +3,17 @@ import os
 import re
 import io
 import json
+import time
+import signal
+import types
+import hashlib
+import marshal
+import pstats
 import asyncio
+import cProfile
+import functools
+import itertools
+from collections import deque, OrderedDict
 from datetime import datetime, timedelta, timezone
 from zoneinfo import ZoneInfo
 from typing import Optional, List, Tuple
@@ -56,13 +66,27 @@ CHANNEL_ID_SERVER_SPOTLIGHT = 1425015637197066260    # tujuan announce
 REACTION_EMOJI = "🔆"
 TZ = ZoneInfo("Asia/Jakarta")
 
+BOOT_T0 = time.perf_counter()
+
+# "full" = cache & chunk semua member (default discord.py)
+# "lean" = tanpa chunking saat startup, tanpa cache member; hanya LRU kecil member yg baru aktif
+MEMBER_CACHE_MODE = os.getenv("MEMBER_CACHE_MODE", "full").lower()
+MEMBER_LRU_SIZE   = int(os.getenv("MEMBER_LRU_SIZE", "2000"))
+MEMBER_LRU_TTL    = 300.0    # detik; role member di LRU tidak di-update gateway → jangan dipakai terlalu lama
+
 intents = discord.Intents.default()
-intents.members = True
+intents.members = True       # tetap perlu untuk event join / leave
 intents.guilds = True
 intents.message_content = True
 intents.reactions = True
 
-bot = commands.Bot(command_prefix="!", intents=intents)
+bot_options = {}
+if MEMBER_CACHE_MODE == "lean":
+    bot_options = {
+        "member_cache_flags": discord.MemberCacheFlags.none(),
+        "chunk_guilds_at_startup": False,
+    }
+bot = commands.Bot(command_prefix="!", intents=intents, **bot_options)
 KONTEN_LIMIT = 1000
 MAX_UPLOAD_BYTES = 25 * 1024 * 1024  # 25 MB
 URL_ANY = re.compile(r"(https?://\S+)", re.IGNORECASE)
@@ -115,42 +139,77 @@ def parse_natural_time(text: str, ref: datetime):
 # =========================
 # FIRESTORE HELPERS  (disesuaikan dgn struktur: config/downloader)
 # =========================
-WELCOME_COL   = "welcome_messages"
+WELCOME_COL   = "welcome_messages"    # doc "{guild_id}-{user_id}" (lama: "{user_id}"): message_id, channel_id
 MABAR_COL     = "mabar_reminders"
 CONFIG_COL    = "config"
 DL_DOC_ID     = "downloader"          # fields: status ("on"/"off"), info_msg (int), updated (string)
 ANNOUNCE_COL  = "announcements"
+DL_THREAD_COL = "downloader_threads"  # doc "{guild_id}-{user_id}": thread_id, user_id, guild_id
+REACTION_ROLE_COL = "reaction_roles"  # doc message_id: guild_id, channel_id, bindings [{emoji, role_id}]
+GUILD_COL     = "guild_config"        # doc guild_id: ID channel/role + downloader_status, downloader_info_msg
+MEDIA_FWD_COL = "media_forwards"      # doc "{guild_id}-{key}": channel_id, message_id (dedup forward Photo-Media)
 
-async def save_welcome_message(user_id: int, message_id: int):
+def _welcome_doc_id(guild_id: int, user_id: int) -> str:
+    return f"{guild_id}-{user_id}" if guild_id else str(user_id)
+
+async def save_welcome_message(guild_id: int, user_id: int, message_id: int, channel_id: int = 0):
     try:
-        db.collection(WELCOME_COL).document(str(user_id)).set({
+        db.collection(WELCOME_COL).document(_welcome_doc_id(guild_id, user_id)).set({
             "message_id": message_id,
+            "guild_id": guild_id,
+            "user_id": user_id,
+            "channel_id": channel_id,
             "created_at": firestore.SERVER_TIMESTAMP
         })
     except Exception as e:
         print("[WARN] save_welcome_message:", e)
 
-async def get_welcome_message(user_id: int) -> Optional[int]:
+async def get_welcome_message(guild_id: int, user_id: int) -> Optional[int]:
     try:
-        doc = db.collection(WELCOME_COL).document(str(user_id)).get()
+        doc = db.collection(WELCOME_COL).document(_welcome_doc_id(guild_id, user_id)).get()
         if doc.exists:
             return int(doc.to_dict().get("message_id") or 0) or None
     except Exception as e:
         print("[WARN] get_welcome_message:", e)
     return None
 
-async def delete_welcome_message(user_id: int):
+async def delete_welcome_message(guild_id: int, user_id: int):
     try:
-        db.collection(WELCOME_COL).document(str(user_id)).delete()
+        db.collection(WELCOME_COL).document(_welcome_doc_id(guild_id, user_id)).delete()
     except Exception as e:
         print("[WARN] delete_welcome_message:", e)
 
+def load_welcome_messages() -> List[Tuple[str, dict]]:
+    try:
+        return [(d.id, d.to_dict()) for d in db.collection(WELCOME_COL).stream()]
+    except Exception as e:
+        print("[WARN] load_welcome_messages:", e)
+        return []
+
+def migrate_welcome_doc(old_id: str, guild_id: int, user_id: int, data: dict):
+    """Pindahkan doc lama "{user_id}" ke "{guild_id}-{user_id}"."""
+    try:
+        db.collection(WELCOME_COL).document(_welcome_doc_id(guild_id, user_id)).set(
+            {**data, "guild_id": guild_id, "user_id": user_id})
+        db.collection(WELCOME_COL).document(old_id).delete()
+    except Exception as e:
+        print("[WARN] migrate_welcome_doc:", e)
+
 def save_mabar_schedule(doc_id: str, data: dict):
     try:
         db.collection(MABAR_COL).document(doc_id).set(data)
     except Exception as e:
         print("[WARN] save_mabar_schedule:", e)
 
+def get_mabar_status(doc_id: str) -> Optional[str]:
+    """Status doc mabar ("" kalau doc tidak ada), None kalau Firestore gagal dibaca."""
+    try:
+        doc = db.collection(MABAR_COL).document(doc_id).get()
+        return str((doc.to_dict() or {}).get("status") or "") if doc.exists else ""
+    except Exception as e:
+        print("[WARN] get_mabar_status:", e)
+        return None
+
 def update_mabar_status(doc_id: str, **fields):
     try:
         db.collection(MABAR_COL).document(doc_id).update(fields)
@@ -175,6 +234,7 @@ def _dl_ref():
     return db.collection(CONFIG_COL).document(DL_DOC_ID)
 
 def get_downloader_config() -> dict:
+    """Konfig lama (config/downloader); dipakai sebagai default guild yang belum punya guild_config."""
     try:
         snap = _dl_ref().get()
         return snap.to_dict() if snap.exists else {}
@@ -182,34 +242,126 @@ def get_downloader_config() -> dict:
         print("[WARN] get_downloader_config:", e)
         return {}
 
-def get_downloader_enabled(guild_id: int) -> bool:
-    # guild_id tidak dipakai di struktur baru; tetap ada utk kompatibilitas
-    cfg = get_downloader_config()
-    return str(cfg.get("status", "on")).lower() == "on"
+def load_guild_configs() -> dict:
+    try:
+        return {int(d.id): d.to_dict() for d in db.collection(GUILD_COL).stream() if d.id.isdigit()}
+    except Exception as e:
+        print("[WARN] load_guild_configs:", e)
+        return {}
+
+def get_guild_config_doc(guild_id: int) -> Optional[dict]:
+    try:
+        snap = db.collection(GUILD_COL).document(str(guild_id)).get()
+        return snap.to_dict() if snap.exists else None
+    except Exception as e:
+        print("[WARN] get_guild_config_doc:", e)
+        return None
 
-def set_downloader_status(on: bool):
+def save_guild_config(guild_id: int, **fields):
     try:
-        _dl_ref().set(
-            {"status": "on" if on else "off", "updated": now_wib().isoformat()},
-            merge=True
+        db.collection(GUILD_COL).document(str(guild_id)).set(
+            {**fields, "updated": now_wib().isoformat()}, merge=True
         )
     except Exception as e:
-        print("[WARN] set_downloader_status:", e)
+        print("[WARN] save_guild_config:", e)
+
+def watch_guild_configs(callback):
+    """callback(guild_id, data|None) dipanggil dari thread listener Firestore."""
+    def on_snapshot(_docs, changes, _read_time):
+        for ch in changes:
+            if not ch.document.id.isdigit():
+                continue
+            removed = getattr(ch.type, "name", "") == "REMOVED"
+            callback(int(ch.document.id), None if removed else ch.document.to_dict())
+    try:
+        return db.collection(GUILD_COL).on_snapshot(on_snapshot)
+    except Exception as e:
+        print("[WARN] watch_guild_configs:", e)
+        return None
+
+def load_downloader_threads() -> dict:
+    try:
+        index = {}
+        for d in db.collection(DL_THREAD_COL).stream():
+            dat = d.to_dict()
+            if "guild_id" in dat and "user_id" in dat and "thread_id" in dat:
+                index[(int(dat["guild_id"]), int(dat["user_id"]))] = int(dat["thread_id"])
+        return index
+    except Exception as e:
+        print("[WARN] load_downloader_threads:", e)
+        return {}
+
+def save_downloader_thread(guild_id: int, user_id: int, thread_id: int):
+    try:
+        db.collection(DL_THREAD_COL).document(f"{guild_id}-{user_id}").set({
+            "guild_id": guild_id,
+            "user_id": user_id,
+            "thread_id": thread_id,
+            "updated": now_wib().isoformat()
+        })
+    except Exception as e:
+        print("[WARN] save_downloader_thread:", e)
+
+def delete_downloader_thread(guild_id: int, user_id: int):
+    try:
+        db.collection(DL_THREAD_COL).document(f"{guild_id}-{user_id}").delete()
+    except Exception as e:
+        print("[WARN] delete_downloader_thread:", e)
+
+def load_changed_since(collection: str, field: str, value) -> List[Tuple[str, dict]]:
+    """Query incremental: dokumen dengan field > value (dipakai rekonsiliasi setelah snapshot)."""
+    try:
+        return [(d.id, d.to_dict()) for d in db.collection(collection).where(field, ">", value).stream()]
+    except Exception as e:
+        print(f"[WARN] load_changed_since {collection}:", e)
+        return []
 
-def get_downloader_notice_id() -> Optional[int]:
+def load_reaction_menus() -> Optional[List[dict]]:
+    """Semua menu reaction-role; None kalau Firestore gagal dibaca (beda dengan koleksi kosong)."""
     try:
-        cfg = get_downloader_config()
-        mid = cfg.get("info_msg")
-        return int(mid) if isinstance(mid, (int, float, str)) and str(mid).isdigit() else None
+        return [{**d.to_dict(), "message_id": int(d.id)} for d in db.collection(REACTION_ROLE_COL).stream()]
     except Exception as e:
-        print("[WARN] get_downloader_notice_id:", e)
+        print("[WARN] load_reaction_menus:", e)
         return None
 
-def set_downloader_notice_id(message_id: int):
+def save_reaction_menu(message_id: int, guild_id: int, channel_id: int, bindings: List[dict]):
+    try:
+        ref = db.collection(REACTION_ROLE_COL).document(str(message_id))
+        if bindings:
+            ref.set({"guild_id": guild_id, "channel_id": channel_id, "bindings": bindings,
+                     "updated": now_wib().isoformat()})
+        else:
+            ref.delete()
+    except Exception as e:
+        print("[WARN] save_reaction_menu:", e)
+
+def load_media_forwards() -> List[dict]:
     try:
-        _dl_ref().set({"info_msg": int(message_id), "updated": now_wib().isoformat()}, merge=True)
+        return [d.to_dict() for d in db.collection(MEDIA_FWD_COL).stream()]
     except Exception as e:
-        print("[WARN] set_downloader_notice_id:", e)
+        print("[WARN] load_media_forwards:", e)
+        return []
+
+def save_media_forwards(guild_id: int, channel_id: int, message_id: int, keys: List[str]):
+    try:
+        batch = db.batch()
+        for key in keys:
+            batch.set(db.collection(MEDIA_FWD_COL).document(f"{guild_id}-{key}"), {
+                "guild_id": guild_id, "key": key, "channel_id": channel_id, "message_id": message_id,
+                "updated": now_wib().isoformat(),
+            })
+        batch.commit()
+    except Exception as e:
+        print("[WARN] save_media_forwards:", e)
+
+def delete_media_forwards(items: List[Tuple[int, str]]):
+    try:
+        batch = db.batch()
+        for guild_id, key in items:
+            batch.delete(db.collection(MEDIA_FWD_COL).document(f"{guild_id}-{key}"))
+        batch.commit()
+    except Exception as e:
+        print("[WARN] delete_media_forwards:", e)
 
 def log_announcement(data: dict):
     try:
@@ -217,26 +369,513 @@ def log_announcement(data: dict):
     except Exception as e:
         print("[WARN] log_announcement:", e)
 
+def save_scheduled_announcement(data: dict) -> Optional[str]:
+    try:
+        ref = db.collection(ANNOUNCE_COL).document()
+        ref.set({**data, "status": "scheduled", "created_at": firestore.SERVER_TIMESTAMP})
+        return ref.id
+    except Exception as e:
+        print("[WARN] save_scheduled_announcement:", e)
+        return None
+
+def get_announcement(doc_id: str) -> Optional[dict]:
+    """Dokumen pengumuman ({} kalau tidak ada), None kalau Firestore gagal dibaca."""
+    try:
+        doc = db.collection(ANNOUNCE_COL).document(doc_id).get()
+        return (doc.to_dict() or {}) if doc.exists else {}
+    except Exception as e:
+        print("[WARN] get_announcement:", e)
+        return None
+
+def update_announcement(doc_id: str, **fields):
+    try:
+        db.collection(ANNOUNCE_COL).document(doc_id).update(fields)
+    except Exception as e:
+        print("[WARN] update_announcement:", e)
+
+def load_scheduled_announcements() -> List[Tuple[str, dict]]:
+    try:
+        q = db.collection(ANNOUNCE_COL).where("status", "==", "scheduled").stream()
+        return [(d.id, d.to_dict()) for d in q if "fire_at_epoch" in d.to_dict()]
+    except Exception as e:
+        print("[WARN] load_scheduled_announcements:", e)
+        return []
+
+# =========================
+# KONFIG PER GUILD (registry in-memory)
+# =========================
+# Nilai default = konstanta di atas (server asal). Semua lookup lewat guild.get_channel / get_role,
+# jadi ID milik guild lain otomatis tidak cocok dan fiturnya diam sampai guild itu dikonfigurasi.
+GUILD_CHANNEL_KEYS = {
+    "welcome_channel":     CHANNEL_ID_WELCOME,
+    "logs_channel":        CHANNEL_ID_LOGS,
+    "mabar_channel":       CHANNEL_ID_MABAR,
+    "intro_channel":       CHANNEL_ID_INTRO,
+    "rules_channel":       RULES_CHANNEL_ID,
+    "photo_media_channel": CHANNEL_ID_PHOTO_MEDIA,
+    "downloader_channel":  CHANNEL_ID_DOWNLOADER,
+    "link_detect_channel": CHANNEL_ID_LINK_DETECT,
+    "spotlight_channel":   CHANNEL_ID_SERVER_SPOTLIGHT,
+}
+GUILD_ROLE_KEYS = {
+    "light_role": ROLE_ID_LIGHT,
+}
+
+def _as_id(value, default: int) -> int:
+    try:
+        return int(value) if value is not None and str(value).isdigit() else default
+    except Exception:
+        return default
+
+class GuildConfig:
+    welcome_channel: int
+    logs_channel: int
+    mabar_channel: int
+    intro_channel: int
+    rules_channel: int
+    photo_media_channel: int
+    downloader_channel: int
+    link_detect_channel: int
+    spotlight_channel: int
+    light_role: int
+
+    def __init__(self, guild_id: int, data: Optional[dict] = None, legacy: Optional[dict] = None):
+        data = data or {}
+        legacy = legacy or {}
+        self.guild_id = guild_id
+        for key, default in {**GUILD_CHANNEL_KEYS, **GUILD_ROLE_KEYS}.items():
+            setattr(self, key, _as_id(data.get(key), default))
+        status = data.get("downloader_status", legacy.get("status", "on"))
+        self.downloader_on = str(status).lower() == "on"
+        self.downloader_notice_id = _as_id(data.get("downloader_info_msg", legacy.get("info_msg")), 0) or None
+
+    def to_doc(self) -> dict:
+        doc = {key: getattr(self, key) for key in {**GUILD_CHANNEL_KEYS, **GUILD_ROLE_KEYS}}
+        doc["downloader_status"] = "on" if self.downloader_on else "off"
+        if self.downloader_notice_id:
+            doc["downloader_info_msg"] = self.downloader_notice_id
+        return doc
+
+_guild_configs: dict[int, GuildConfig] = {}
+_legacy_downloader: dict = {}
+
+def guild_cfg(guild_id: Optional[int]) -> GuildConfig:
+    """O(1), tanpa baca database. Guild yang belum dimuat memakai default."""
+    cfg = _guild_configs.get(guild_id or 0)
+    if cfg is None:
+        cfg = GuildConfig(guild_id or 0, legacy=_legacy_downloader)
+        if guild_id:
+            _guild_configs[guild_id] = cfg
+    return cfg
+
+def apply_guild_config(guild_id: int, data: Optional[dict]):
+    _guild_configs[guild_id] = GuildConfig(guild_id, data, legacy=_legacy_downloader)
+
+def load_guild_registry():
+    _legacy_downloader.clear()
+    _legacy_downloader.update(get_downloader_config())
+    docs = load_guild_configs()
+    for guild_id, data in docs.items():
+        apply_guild_config(guild_id, data)
+    print(f"🗂️ Konfig {len(docs)} guild dimuat.")
+
+def start_guild_config_listener(loop: asyncio.AbstractEventLoop):
+    def on_change(guild_id: int, data: Optional[dict]):
+        loop.call_soon_threadsafe(apply_guild_config, guild_id, data)
+    return watch_guild_configs(on_change)
+
+def get_downloader_enabled(guild_id: int) -> bool:
+    return guild_cfg(guild_id).downloader_on
+
+def set_downloader_status(guild_id: int, on: bool):
+    guild_cfg(guild_id).downloader_on = on
+    save_guild_config(guild_id, downloader_status="on" if on else "off")
+
+def set_downloader_notice_id(guild_id: int, message_id: int):
+    guild_cfg(guild_id).downloader_notice_id = int(message_id)
+    save_guild_config(guild_id, downloader_info_msg=int(message_id))
+
+# =========================
+# OUTBOUND SCHEDULER (rate limit per channel + prioritas)
+# =========================
+PRIO_HIGH   = 0    # pengumuman, reminder mabar
+PRIO_NORMAL = 1    # welcome / goodbye, log moderator
+PRIO_LOW    = 2    # tips & notice sementara (boleh digabung / dibuang)
+
+SEND_BURST          = 5       # token maksimum per channel
+SEND_REFILL_SECONDS = 5.0     # waktu isi ulang SEND_BURST token
+COALESCE_WINDOW     = 60.0    # notice ephemeral yg sama ke user yg sama → dibuang
+WORKER_IDLE_SECONDS = 60.0    # worker channel berhenti kalau antrian kosong selama ini
+
+class _TokenBucket:
+    def __init__(self, capacity: int, refill_seconds: float):
+        self.capacity = float(capacity)
+        self.rate = capacity / refill_seconds
+        self.tokens = float(capacity)
+        self.updated = time.monotonic()
+
+    def _refill(self):
+        now = time.monotonic()
+        self.tokens = min(self.capacity, self.tokens + (now - self.updated) * self.rate)
+        self.updated = now
+
+    def wait_time(self) -> float:
+        self._refill()
+        return 0.0 if self.tokens >= 1 else (1 - self.tokens) / self.rate
+
+    def consume(self):
+        self.tokens -= 1
+
+    def penalize(self, seconds: float):
+        # setelah 429: kosongkan bucket supaya channel ini istirahat dulu
+        self._refill()
+        self.tokens = min(self.tokens, -seconds * self.rate)
+
+def _retry_after_seconds(e: discord.HTTPException) -> float:
+    """Header Retry-After dari respons 429; fallback ke satu periode refill."""
+    try:
+        return float(e.response.headers.get("Retry-After") or SEND_REFILL_SECONDS)
+    except (AttributeError, TypeError, ValueError):
+        return SEND_REFILL_SECONDS
+
+class OutboundScheduler:
+    """
+    Semua pesan keluar lewat sini: satu antrian prioritas + token bucket per channel.
+    Item prioritas lebih tinggi (angka kecil) selalu dikirim lebih dulu.
+    Notice PRIO_LOW dengan coalesce_key yang sama dalam COALESCE_WINDOW dibuang.
+    """
+    def __init__(self):
+        self._queues: dict[int, asyncio.PriorityQueue] = {}
+        self._workers: dict[int, asyncio.Task] = {}
+        self._buckets: dict[int, _TokenBucket] = {}
+        self._recent: dict[tuple, float] = {}
+        self._seq = itertools.count()
+
+    def _is_duplicate(self, key: tuple) -> bool:
+        now = time.monotonic()
+        if len(self._recent) > 1024:
+            self._recent = {k: t for k, t in self._recent.items() if now - t < COALESCE_WINDOW}
+        last = self._recent.get(key)
+        if last is not None and now - last < COALESCE_WINDOW:
+            return True
+        self._recent[key] = now
+        return False
+
+    async def send(self, channel: discord.abc.Messageable, content: Optional[str] = None, *,
+                   priority: int = PRIO_NORMAL, coalesce_key: Optional[tuple] = None,
+                   **kwargs) -> Optional[discord.Message]:
+        """Kirim via antrian. Return None kalau notice dibuang karena duplikat."""
+        if coalesce_key is not None and self._is_duplicate((channel.id, *coalesce_key)):
+            return None
+
+        fut = asyncio.get_running_loop().create_future()
+        q = self._queues.setdefault(channel.id, asyncio.PriorityQueue())
+        q.put_nowait((priority, next(self._seq), channel, content, kwargs, fut))
+        worker = self._workers.get(channel.id)
+        if worker is None or worker.done():
+            self._workers[channel.id] = asyncio.create_task(self._worker(channel.id))
+        return await fut
+
+    async def _worker(self, channel_id: int):
+        q = self._queues[channel_id]
+        bucket = self._buckets.setdefault(channel_id, _TokenBucket(SEND_BURST, SEND_REFILL_SECONDS))
+        while True:
+            try:
+                item = await asyncio.wait_for(q.get(), timeout=WORKER_IDLE_SECONDS)
+            except asyncio.TimeoutError:
+                # send() bisa menaruh item di tick yang sama saat timeout terjadi (worker belum done)
+                if not q.empty():
+                    continue
+                self._workers.pop(channel_id, None)
+                return
+            priority, _, channel, content, kwargs, fut = item
+            if fut.cancelled():
+                continue
+            wait = bucket.wait_time()
+            if wait > 0:
+                # kembalikan ke antrian; item yg lebih penting bisa masuk selama menunggu
+                q.put_nowait(item)
+                await asyncio.sleep(wait)
+                continue
+            bucket.consume()
+            try:
+                msg = await channel.send(content, **kwargs)
+            except discord.HTTPException as e:
+                if e.status == 429:
+                    bucket.penalize(_retry_after_seconds(e))
+                if not fut.done():
+                    fut.set_exception(e)
+            except Exception as e:
+                if not fut.done():
+                    fut.set_exception(e)
+            else:
+                if not fut.done():
+                    fut.set_result(msg)
+
+outbox = OutboundScheduler()
+
+# =========================
+# EVENT-LOOP LAG MONITOR + LOAD SHEDDING
+# =========================
+LAG_SAMPLE_INTERVAL = 0.5                                      # detik antar sampel
+LAG_DEGRADE_MS      = float(os.getenv("LAG_DEGRADE_MS", "250"))  # level 1: tips off, log hapus jadi digest
+LAG_SHED_MS         = float(os.getenv("LAG_SHED_MS", "1000"))    # level 2: + prompt forward gambar di-skip
+LAG_RECOVER_SAMPLES = 20                                       # sampel tenang berturut-turut sebelum turun level
+
+LOAD_NORMAL, LOAD_DEGRADED, LOAD_SHEDDING = 0, 1, 2
+
+class LoopLagMonitor:
+    """Ukur keterlambatan jadwal event loop (sleep yang molor) → level beban untuk mematikan fitur opsional."""
+    def __init__(self):
+        self.last_ms = 0.0
+        self.ewma_ms = 0.0
+        self.peak_ms = 0.0          # puncak sejak level terakhir berubah
+        self.level = LOAD_NORMAL
+        self._calm = 0
+        self._listeners: list = []
+
+    def on_level_change(self, callback):
+        self._listeners.append(callback)
+
+    def _target_level(self) -> int:
+        if self.ewma_ms >= LAG_SHED_MS:
+            return LOAD_SHEDDING
+        if self.ewma_ms >= LAG_DEGRADE_MS:
+            return LOAD_DEGRADED
+        return LOAD_NORMAL
+
+    def observe(self, lag_ms: float):
+        self.last_ms = lag_ms
+        self.ewma_ms = 0.7 * self.ewma_ms + 0.3 * lag_ms
+        self.peak_ms = max(self.peak_ms, lag_ms)
+        target = self._target_level()
+        if target > self.level:
+            self._set_level(target)
+        elif target < self.level:
+            # turun pelan-pelan (hysteresis) supaya tidak bolak-balik
+            self._calm += 1
+            if self._calm >= LAG_RECOVER_SAMPLES:
+                self._set_level(self.level - 1)
+        else:
+            self._calm = 0
+
+    def _set_level(self, level: int):
+        prev, self.level, self._calm = self.level, level, 0
+        print(f"[load] level {prev} → {level} (lag ewma {self.ewma_ms:.0f}ms, puncak {self.peak_ms:.0f}ms)")
+        self.peak_ms = 0.0
+        for cb in self._listeners:
+            try:
+                cb(prev, level)
+            except Exception as e:
+                print("[WARN] load listener:", e)
+
+    async def run(self):
+        loop = asyncio.get_running_loop()
+        while True:
+            t0 = loop.time()
+            await asyncio.sleep(LAG_SAMPLE_INTERVAL)
+            self.observe(max(0.0, (loop.time() - t0 - LAG_SAMPLE_INTERVAL) * 1000))
+
+loop_lag = LoopLagMonitor()
+
+# =========================
+# GATEWAY EVENT RECORDER (opsional; diputar ulang dengan replay_load.py)
+# =========================
+EVENT_RECORD_PATH    = os.getenv("EVENT_RECORD_PATH", "")   # kosong = recorder mati
+RECORD_FLUSH_SECONDS = 5.0
+
+_RECORD_URL    = re.compile(r"https?://([^/\s]+)\S*", re.IGNORECASE)
+_RECORD_LETTER = re.compile(r"[^\W\d_]")
+_RECORD_DIGITS = re.compile(r"\d+")
+
+class EventRecorder:
+    """
+    Tulis event gateway (pesan, reaksi, join, hapus) ke JSONL dalam bentuk anonim:
+    ID user & pesan di-hash dengan salt acak per proses, huruf di konten diganti "x",
+    deret angka lain (nomor HP, OTP, dll.) diganti "9" dengan panjang yang sama,
+    URL hanya menyisakan host-nya, prefix perintah (!dw, !mabar, ...) dipertahankan.
+    ID guild / channel / role tetap asli supaya replay melewati jalur handler yang sama.
+    """
+    def __init__(self, path: str):
+        self.path = path
+        self._salt = os.urandom(16)
+        self._t0 = time.monotonic()
+        self._buf: List[str] = []
+
+    def anon(self, snowflake: int) -> int:
+        digest = hashlib.blake2b(str(snowflake).encode(), key=self._salt, digest_size=7).digest()
+        return int.from_bytes(digest, "big") | (1 << 58)
+
+    def _anon_digits(self, m: re.Match) -> str:
+        digits = m.group()
+        if 15 <= len(digits) <= 20:
+            return str(self.anon(int(digits)))     # snowflake (mention, ID) → hash
+        return "9" * len(digits)
+
+    def _anon_plain(self, text: str) -> str:
+        text = _RECORD_DIGITS.sub(self._anon_digits, text)
+        return _RECORD_LETTER.sub("x", text)
+
+    def anon_text(self, text: str) -> str:
+        prefix = ""
+        if text.startswith("!"):
+            cmd, sep, text = text.partition(" ")
+            prefix = cmd + sep
+        out, last = [], 0
+        for m in _RECORD_URL.finditer(text):
+            out.append(self._anon_plain(text[last:m.start()]))
+            out.append(f"https://{m.group(1)}/{'x' * 8}")
+            last = m.end()
+        out.append(self._anon_plain(text[last:]))
+        return prefix + "".join(out)
+
+    def record(self, kind: str, **fields):
+        self._buf.append(json.dumps({"t": round(time.monotonic() - self._t0, 3), "type": kind, **fields}))
+
+    def _write(self, lines: List[str]):
+        with open(self.path, "a", encoding="utf-8") as f:
+            f.write("\n".join(lines) + "\n")
+
+    async def flush(self):
+        if not self._buf:
+            return
+        lines, self._buf = self._buf, []
+        try:
+            await asyncio.to_thread(self._write, lines)
+        except Exception as e:
+            print("[WARN] recorder flush:", e)
+
+    async def run(self):
+        print(f"🎙️ Merekam event gateway ke {self.path}")
+        while not bot.is_closed():
+            await asyncio.sleep(RECORD_FLUSH_SECONDS)
+            await self.flush()
+
+recorder: Optional[EventRecorder] = EventRecorder(EVENT_RECORD_PATH) if EVENT_RECORD_PATH else None
+
+def _role_ids(member) -> List[int]:
+    return [r.id for r in getattr(member, "roles", [])[1:]]   # tanpa @everyone
+
+if recorder:
+    @bot.listen("on_message")
+    async def _record_message(message: discord.Message):
+        if message.author.bot or not message.guild:
+            return
+        parent_id = message.channel.parent_id if isinstance(message.channel, discord.Thread) else None
+        recorder.record(
+            "message",
+            guild_id=message.guild.id,
+            channel_id=message.channel.id,
+            thread_parent_id=parent_id,
+            message_id=recorder.anon(message.id),
+            author_id=recorder.anon(message.author.id),
+            author_roles=_role_ids(message.author),
+            content=recorder.anon_text(message.content or ""),
+            attachments=[{
+                "filename": "file" + os.path.splitext(a.filename or "")[1].lower(),
+                "content_type": a.content_type,
+                "size": a.size,
+                "width": a.width,
+                "height": a.height,
+            } for a in message.attachments],
+        )
+
+    @bot.listen("on_raw_reaction_add")
+    async def _record_reaction(payload: discord.RawReactionActionEvent):
+        if payload.guild_id is None or (payload.member and payload.member.bot):
+            return
+        recorder.record(
+            "reaction_add",
+            guild_id=payload.guild_id,
+            channel_id=payload.channel_id,
+            message_id=recorder.anon(payload.message_id),
+            user_id=recorder.anon(payload.user_id),
+            user_roles=_role_ids(payload.member),
+            emoji=str(payload.emoji),
+        )
+
+    @bot.listen("on_member_join")
+    async def _record_join(member: discord.Member):
+        recorder.record("member_join", guild_id=member.guild.id, user_id=recorder.anon(member.id))
+
+    @bot.listen("on_raw_message_delete")
+    async def _record_delete(payload: discord.RawMessageDeleteEvent):
+        if payload.guild_id is None:
+            return
+        recorder.record("message_delete", guild_id=payload.guild_id, channel_id=payload.channel_id,
+                        message_id=recorder.anon(payload.message_id))
+
 # =========================
 # STARTUP
 # =========================
+_startup_done = False
+
 @bot.event
 async def on_ready():
+    global _startup_done
     print(f"✅ Bot login sebagai {bot.user}")
     try:
         await bot.change_presence(activity=discord.Game("menjaga server ✨"))
     except Exception:
         pass
 
-    # Resume reminders
-    pending = load_pending_mabar(to_epoch(now_wib()))
-    if pending:
-        print(f"⏲️ Menjadwalkan ulang {len(pending)} reminder mabar dari Firestore.")
-    for doc_id, dat in pending:
-        asyncio.create_task(schedule_mabar_tasks_from_doc(doc_id, dat))
+    # on_ready bisa terpanggil lagi setelah reconnect → jangan jadwalkan ulang
+    if _startup_done:
+        return
+    _startup_done = True
+    print(f"⏱️ Siap dalam {time.perf_counter() - BOOT_T0:.1f}s · {member_cache_report()}")
+
+    # Monitor lag event loop + ringkasan log hapus saat mode hemat
+    asyncio.create_task(loop_lag.run())
+    asyncio.create_task(delete_digest_loop())
+    if recorder:
+        asyncio.create_task(recorder.run())
+
+    # Warm restart: pulihkan state dari snapshot lokal, cek Firestore secara incremental di belakang
+    warn_ephemeral_snapshot()
+    snap = load_snapshot()
+    if snap:
+        restore_from_snapshot(snap)
+        asyncio.create_task(reconcile_with_storage(snap["written_at"]))
+    else:
+        # Registry konfig per guild
+        load_guild_registry()
+
+        # Index reaction-role (menu + pesan welcome) & thread downloader per user
+        load_reaction_roles()
+        load_thread_index()
+        load_media_index()
+
+        # Resume reminders
+        pending = load_pending_mabar(to_epoch(now_wib()))
+        if pending:
+            print(f"⏲️ Menjadwalkan ulang {len(pending)} reminder mabar dari Firestore.")
+        for doc_id, dat in pending:
+            asyncio.create_task(schedule_mabar_tasks_from_doc(doc_id, dat))
+
+        # Resume pengumuman terjadwal
+        resume_scheduled_announcements()
+
+    start_guild_config_listener(asyncio.get_running_loop())
+    asyncio.create_task(downloader_thread_sweeper())
+    asyncio.create_task(snapshot_loop())
+    install_shutdown_handler(asyncio.get_running_loop())
+
+    # Pastikan notice downloader tidak duplikat (lewati yang menurut snapshot sudah benar)
+    for guild in bot.guilds:
+        cfg = guild_cfg(guild.id)
+        if snap and _notice_rendered.get(guild.id) == (cfg.downloader_notice_id, cfg.downloader_on):
+            continue
+        await ensure_downloader_notice(guild)
+
+@bot.event
+async def on_guild_join(guild: discord.Guild):
+    apply_guild_config(guild.id, get_guild_config_doc(guild.id))
+    print(f"➕ Bergabung ke guild {guild.name} ({guild.id}).")
 
-    # Pastikan notice downloader tidak duplikat
-    await ensure_downloader_notice()
+@bot.event
+async def on_guild_remove(guild: discord.Guild):
+    _guild_configs.pop(guild.id, None)
 
 async def _build_downloader_embed(enabled: bool) -> discord.Embed:
     status_bullet = "🟢" if enabled else "🔴"
@@ -251,40 +890,46 @@ async def _build_downloader_embed(enabled: bool) -> discord.Embed:
     embed = discord.Embed(title="Downloader Center", description=desc, color=discord.Color.blurple())
     return embed
 
-async def ensure_downloader_notice():
-    ch = bot.get_channel(CHANNEL_ID_DOWNLOADER)
+_notice_rendered: dict[int, tuple[int, bool]] = {}   # guild_id → (message_id, status yang ditampilkan)
+
+async def ensure_downloader_notice(guild: discord.Guild):
+    cfg = guild_cfg(guild.id)
+    ch = guild.get_channel(cfg.downloader_channel)
     if not isinstance(ch, discord.TextChannel):
         return
-    enabled = get_downloader_enabled(ch.guild.id if ch.guild else 0)
-    embed = await _build_downloader_embed(enabled)
+    embed = await _build_downloader_embed(cfg.downloader_on)
 
-    msg_id = get_downloader_notice_id()
+    msg_id = cfg.downloader_notice_id
     if msg_id:
         # Coba edit. Jika tidak ada (terhapus), kirim ulang.
         try:
             msg = await ch.fetch_message(msg_id)
             await msg.edit(embed=embed)
+            _notice_rendered[guild.id] = (msg.id, cfg.downloader_on)
             return
         except Exception:
             pass
 
     # Kirim baru dan simpan id
     msg = await ch.send(embed=embed)
-    set_downloader_notice_id(msg.id)
+    set_downloader_notice_id(guild.id, msg.id)
+    _notice_rendered[guild.id] = (msg.id, cfg.downloader_on)
 
 # =========================
 # GREETINGS + REACTION ROLE
 # =========================
 @bot.event
 async def on_member_join(member: discord.Member):
-    ch = bot.get_channel(CHANNEL_ID_WELCOME)
+    member_lru.put(member)
+    cfg = guild_cfg(member.guild.id)
+    ch = member.guild.get_channel(cfg.welcome_channel)
     if not isinstance(ch, discord.TextChannel):
         return
 
-    rules_ch = member.guild.get_channel(RULES_CHANNEL_ID) if member.guild else None
+    rules_ch = member.guild.get_channel(cfg.rules_channel)
     rules_text = rules_ch.mention if isinstance(rules_ch, discord.TextChannel) else "#rules"
 
-    role_light = member.guild.get_role(ROLE_ID_LIGHT) if member.guild else None
+    role_light = member.guild.get_role(cfg.light_role)
     role_text = role_light.mention if role_light else "**Light**"
 
     desc = (
@@ -301,106 +946,379 @@ async def on_member_join(member: discord.Member):
     )
     embed.set_footer(text="Selamat bergabung & have fun! ✨")
 
-    msg = await ch.send(embed=embed)
+    msg = await outbox.send(ch, embed=embed, priority=PRIO_NORMAL)
     try:
         await msg.add_reaction(REACTION_EMOJI)
     except Exception:
         pass
 
-    await save_welcome_message(member.id, msg.id)
+    register_welcome_binding(member.guild.id, ch.id, msg.id, member.id)
+    await save_welcome_message(member.guild.id, member.id, msg.id, ch.id)
+    schedule_welcome_autodelete(member.guild.id, member.id, ch.id, msg.id, time.time())
+
+WELCOME_TTL = 24 * 3600
+_welcome_created: dict[tuple[int, int], float] = {}    # (guild_id, user_id) → epoch pesan welcome dibuat
+
+def schedule_welcome_autodelete(guild_id: int, user_id: int, channel_id: int, message_id: int, created_at: float):
+    """Hapus pesan welcome 24 jam setelah dibuat; tetap jalan setelah restart (sisa waktunya saja)."""
+    _welcome_created[(guild_id, user_id)] = created_at
 
     async def autodel():
-        await asyncio.sleep(24 * 3600)
-        stored_id = await get_welcome_message(member.id)
-        if stored_id and stored_id == msg.id:
-            try: await msg.delete()
+        await asyncio.sleep(max(0.0, created_at + WELCOME_TTL - time.time()))
+        binding = _welcome_by_member.get((guild_id, user_id))
+        if binding is None or binding.message_id != message_id:
+            return      # role sudah diambil / member keluar / ada pesan welcome baru
+        unregister_welcome_binding(guild_id, user_id)
+        ch = bot.get_channel(channel_id)
+        if isinstance(ch, discord.TextChannel):
+            try: await ch.get_partial_message(message_id).delete()
             except Exception: pass
-            await delete_welcome_message(member.id)
+        await delete_welcome_message(guild_id, user_id)
 
     asyncio.create_task(autodel())
 
 @bot.event
-async def on_member_remove(member: discord.Member):
-    await delete_welcome_message(member.id)
-    ch = bot.get_channel(CHANNEL_ID_WELCOME)
+async def on_raw_member_remove(payload: discord.RawMemberRemoveEvent):
+    # versi raw: tetap terpanggil walau member tidak ada di cache (mode lean)
+    user = payload.user
+    member_lru.drop(payload.guild_id, user.id)
+    unregister_welcome_binding(payload.guild_id, user.id)
+    await delete_welcome_message(payload.guild_id, user.id)
+    guild = bot.get_guild(payload.guild_id)
+    ch = guild.get_channel(guild_cfg(guild.id).welcome_channel) if guild else None
     if not isinstance(ch, discord.TextChannel):
         return
     embed = discord.Embed(
         title="👋 Selamat Tinggal",
-        description=f"{member.display_name} telah keluar dari server.",
+        description=f"{user.display_name} telah keluar dari server.",
         color=discord.Color.red()
     )
-    await ch.send(embed=embed)
+    await outbox.send(ch, embed=embed, priority=PRIO_NORMAL)
+
+class MemberLRU:
+    """Cache member terbatas untuk mode lean; entri kedaluwarsa setelah MEMBER_LRU_TTL."""
+    def __init__(self, capacity: int, ttl: float):
+        self.capacity = capacity
+        self.ttl = ttl
+        self._items: OrderedDict[tuple[int, int], tuple[float, discord.Member]] = OrderedDict()
+        self.hits = 0
+        self.misses = 0
+
+    def __len__(self) -> int:
+        return len(self._items)
+
+    def put(self, member: discord.Member):
+        if MEMBER_CACHE_MODE != "lean" or not isinstance(member, discord.Member):
+            return
+        key = (member.guild.id, member.id)
+        self._items[key] = (time.monotonic(), member)
+        self._items.move_to_end(key)
+        while len(self._items) > self.capacity:
+            self._items.popitem(last=False)
+
+    def get(self, guild_id: int, user_id: int) -> Optional[discord.Member]:
+        item = self._items.get((guild_id, user_id))
+        if item is None or time.monotonic() - item[0] > self.ttl:
+            self._items.pop((guild_id, user_id), None)
+            self.misses += 1
+            return None
+        self._items.move_to_end((guild_id, user_id))
+        self.hits += 1
+        return item[1]
+
+    def drop(self, guild_id: int, user_id: int):
+        self._items.pop((guild_id, user_id), None)
+
+member_lru = MemberLRU(MEMBER_LRU_SIZE, MEMBER_LRU_TTL)
 
 async def _safe_get_member(guild: discord.Guild, user_id: int) -> Optional[discord.Member]:
-    m = guild.get_member(user_id)
+    m = guild.get_member(user_id) or member_lru.get(guild.id, user_id)
     if m is None:
         try:
             m = await guild.fetch_member(user_id)
+            member_lru.put(m)
         except Exception:
             m = None
     return m
 
-@bot.event
-async def on_raw_reaction_add(payload: discord.RawReactionActionEvent):
-    if payload.guild_id is None or str(payload.emoji) != REACTION_EMOJI:
-        return
-    target_msg_id = await get_welcome_message(payload.user_id)
-    if not target_msg_id or payload.message_id != target_msg_id:
-        return
+def _rss_mb() -> float:
+    try:
+        with open("/proc/self/status") as f:
+            for line in f:
+                if line.startswith("VmRSS:"):
+                    return int(line.split()[1]) / 1024
+    except Exception:
+        pass
+    try:
+        import resource
+        return resource.getrusage(resource.RUSAGE_SELF).ru_maxrss / 1024
+    except Exception:
+        return 0.0
 
-    guild = bot.get_guild(payload.guild_id)
-    if not guild:
-        return
-    member = await _safe_get_member(guild, payload.user_id)
-    if not member or member.bot:
-        return
-    role = guild.get_role(ROLE_ID_LIGHT)
-    if not role:
-        return
-    channel = bot.get_channel(CHANNEL_ID_WELCOME)
+def member_cache_report() -> str:
+    cached = sum(len(g.members) for g in bot.guilds)
+    total = sum(g.member_count or 0 for g in bot.guilds)
+    return (f"mode cache member: {MEMBER_CACHE_MODE} · cache discord.py: {cached}/{total} member · "
+            f"LRU: {len(member_lru)}/{MEMBER_LRU_SIZE} (hit {member_lru.hits}, miss {member_lru.misses}) · "
+            f"RSS {_rss_mb():.1f} MB")
+
+# ---------- Reaction-role engine ----------
+ROLE_TOGGLE_DEBOUNCE = 3.0   # detik; klik bolak-balik dalam jeda ini digabung jadi satu perubahan
+
+class ReactionBinding:
+    """
+    Satu pasangan (pesan, emoji) → role.
+    owner_id terisi = pesan welcome: hanya member itu yang boleh klik, toggle sekali lalu pesan dihapus.
+    owner_id None   = menu role biasa: tambah role saat react, lepas saat un-react.
+    """
+    __slots__ = ("guild_id", "channel_id", "message_id", "emoji", "role_id", "owner_id")
+
+    def __init__(self, guild_id: int, channel_id: int, message_id: int, emoji: str, role_id: int,
+                 owner_id: Optional[int] = None):
+        self.guild_id = guild_id
+        self.channel_id = channel_id
+        self.message_id = message_id
+        self.emoji = emoji
+        self.role_id = role_id
+        self.owner_id = owner_id
+
+    @property
+    def key(self) -> tuple[int, str]:
+        return self.message_id, self.emoji
+
+_reaction_roles: dict[tuple[int, str], ReactionBinding] = {}   # (message_id, emoji) → binding
+_welcome_by_member: dict[tuple[int, int], ReactionBinding] = {}  # (guild_id, user_id) → binding pesan welcome
+_role_desired: dict[tuple[int, int, str], bool] = {}         # (user, message, emoji) → state terakhir
+_toggle_inflight: set[tuple[int, int, str]] = set()
+
+def register_binding(binding: ReactionBinding):
+    _reaction_roles[binding.key] = binding
+
+def register_welcome_binding(guild_id: int, channel_id: int, message_id: int, user_id: int):
+    binding = ReactionBinding(guild_id, channel_id, message_id, REACTION_EMOJI, guild_cfg(guild_id).light_role,
+                              owner_id=user_id)
+    unregister_welcome_binding(guild_id, user_id)
+    register_binding(binding)
+    _welcome_by_member[(guild_id, user_id)] = binding
+
+def unregister_welcome_binding(guild_id: int, user_id: int):
+    _welcome_created.pop((guild_id, user_id), None)
+    binding = _welcome_by_member.pop((guild_id, user_id), None)
+    if binding:
+        _reaction_roles.pop(binding.key, None)
+
+def menu_bindings(message_id: int) -> List[ReactionBinding]:
+    return [b for (mid, _), b in _reaction_roles.items() if mid == message_id and b.owner_id is None]
+
+def _menu_doc_bindings(menu: dict) -> List[ReactionBinding]:
+    out = []
+    for item in menu.get("bindings") or []:
+        try:
+            out.append(ReactionBinding(
+                int(menu.get("guild_id", 0)), int(menu.get("channel_id", 0)), int(menu["message_id"]),
+                str(item["emoji"]), int(item["role_id"])
+            ))
+        except Exception as e:
+            print("[WARN] reaction menu invalid:", e, menu)
+    return out
 
+def sync_reaction_menus(menus: List[dict]) -> int:
+    """
+    Samakan binding menu di memori dengan daftar doc Firestore (sumber kebenaran):
+    binding yang sudah dihapus/diganti di Firestore ikut dibuang. Binding welcome tidak disentuh.
+    """
+    wanted = {b.key: b for menu in menus for b in _menu_doc_bindings(menu)}
+    changes = 0
+    for key, b in list(_reaction_roles.items()):
+        if b.owner_id is not None:
+            continue
+        w = wanted.get(key)
+        if w is None or (w.role_id, w.guild_id, w.channel_id) != (b.role_id, b.guild_id, b.channel_id):
+            _reaction_roles.pop(key)
+            changes += 1
+    for key, b in wanted.items():
+        if key not in _reaction_roles:
+            register_binding(b)
+            changes += 1
+    return changes
+
+def load_reaction_roles():
+    _reaction_roles.clear()
+    _welcome_by_member.clear()
+    sync_reaction_menus(load_reaction_menus() or [])
+    for doc_id, dat in load_welcome_messages():
+        register_welcome_from_doc(doc_id, dat)
+    print(f"🎭 {len(_reaction_roles)} reaction-role binding dimuat.")
+
+def welcome_doc_key(doc_id: str, dat: dict) -> Optional[tuple[int, int]]:
+    """(guild_id, user_id) dari doc welcome; doc lama tanpa guild ditebak dari channel welcome-nya."""
+    if "-" in doc_id:
+        gid, _, uid = doc_id.partition("-")
+        return (int(gid), int(uid)) if gid.isdigit() and uid.isdigit() else None
+    if not doc_id.isdigit():
+        return None
+    guild_id = int(dat.get("guild_id") or 0)
+    if not guild_id:
+        ch = bot.get_channel(int(dat.get("channel_id") or CHANNEL_ID_WELCOME))
+        guild_id = ch.guild.id if isinstance(ch, discord.TextChannel) else 0
+    return guild_id, int(doc_id)
+
+def register_welcome_from_doc(doc_id: str, dat: dict):
+    key = welcome_doc_key(doc_id, dat)
+    mid = int(dat.get("message_id") or 0)
+    if key is None or not mid:
+        return
+    guild_id, user_id = key
+    if guild_id and doc_id != _welcome_doc_id(guild_id, user_id):
+        asyncio.create_task(asyncio.to_thread(migrate_welcome_doc, doc_id, guild_id, user_id, dat))
+    channel_id = int(dat.get("channel_id") or CHANNEL_ID_WELCOME)
+    created = dat.get("created_at")
+    created_at = created.timestamp() if hasattr(created, "timestamp") else time.time()
+    register_welcome_binding(guild_id, channel_id, mid, user_id)
+    schedule_welcome_autodelete(guild_id, user_id, channel_id, mid, created_at)
+
+def _lookup_binding(payload: discord.RawReactionActionEvent) -> Optional[ReactionBinding]:
+    if payload.guild_id is None:
+        return None
+    binding = _reaction_roles.get((payload.message_id, str(payload.emoji)))
+    if binding is None or (binding.guild_id and binding.guild_id != payload.guild_id):
+        return None
+    if binding.owner_id is not None and binding.owner_id != payload.user_id:
+        return None
+    return binding
+
+async def _apply_role(guild: discord.Guild, user_id: int, binding: ReactionBinding, add: bool,
+                      member: Optional[discord.Member] = None):
+    key = (user_id, binding.message_id, binding.emoji)
+    _role_desired[key] = add
+    if key in _toggle_inflight:
+        return      # worker yg sedang jalan akan memakai state terakhir
+    _toggle_inflight.add(key)
     try:
-        if role not in member.roles:
-            await member.add_roles(role, reason="Welcome role Light")
-            intro_channel = guild.get_channel(CHANNEL_ID_INTRO)
-            if isinstance(intro_channel, discord.TextChannel):
-                await intro_channel.send(
-                    f"Ekhem… {member.mention}! Sebutin umur kamu aja boleh kok. "
-                    f"Kalau mau cerita lebih, juga boleh, ngga perlu terlalu detail, ya!"
-                )
-        else:
+        member = member or await _safe_get_member(guild, user_id)
+        role = guild.get_role(binding.role_id)
+        if not member or member.bot or not role:
+            return
+        if binding.owner_id is not None:
+            await _toggle_welcome_role(guild, member, role, binding)
+            return
+        # debounce: terapkan state sekarang, lalu tunggu; klik bolak-balik selama jeda
+        # hanya mengubah _role_desired dan diterapkan sekali di akhir
+        has_role = role in member.roles
+        while True:
+            want = _role_desired[key]
+            if want != has_role:
+                try:
+                    if want:
+                        await member.add_roles(role, reason="Reaction role")
+                    else:
+                        await member.remove_roles(role, reason="Reaction role dilepas")
+                    has_role = want
+                    # objek Member di LRU tidak ikut berubah (lean mode tanpa GUILD_MEMBER_UPDATE)
+                    member_lru.drop(guild.id, user_id)
+                except Exception as e:
+                    print("[ERROR] reaction role:", e)
+                    return
+            await asyncio.sleep(ROLE_TOGGLE_DEBOUNCE)
+            if _role_desired[key] == has_role:
+                return
+    finally:
+        _toggle_inflight.discard(key)
+        _role_desired.pop(key, None)
+
+async def _toggle_welcome_role(guild: discord.Guild, member: discord.Member, role: discord.Role,
+                               binding: ReactionBinding):
+    # pesan welcome cuma sekali pakai → lepas dari index dulu supaya reaksi susulan tidak diproses
+    unregister_welcome_binding(binding.guild_id, member.id)
+    had_role = role in member.roles
+    channel = bot.get_channel(binding.channel_id)
+
+    async def change_role():
+        if had_role:
             await member.remove_roles(role, reason="Remove role Light")
-    except Exception as e:
-        print("[ERROR] Toggle role:", e)
+        else:
+            await member.add_roles(role, reason="Welcome role Light")
+        member_lru.drop(guild.id, member.id)
+
+    async def fetch_welcome() -> Optional[discord.Message]:
+        if not isinstance(channel, discord.TextChannel):
+            return None
+        try:
+            return await channel.fetch_message(binding.message_id)
+        except Exception:
+            return None
+
+    role_res, msg = await asyncio.gather(change_role(), fetch_welcome(), return_exceptions=True)
+    if isinstance(role_res, Exception):
+        print("[ERROR] Toggle role:", role_res)
+        await delete_welcome_message(binding.guild_id, member.id)
         return
 
-    try:
-        if isinstance(channel, discord.TextChannel):
-            msg = await channel.fetch_message(target_msg_id)
-            have_role = role in member.roles
-            status = "✅ Role Light diberikan." if have_role else "❎ Role Light dilepas."
-            new_embed = msg.embeds[0] if msg.embeds else discord.Embed(color=discord.Color.green())
-            new_embed.set_footer(text=status + " (pesan akan dihapus sebentar lagi)")
-            await msg.edit(embed=new_embed)
-            await asyncio.sleep(8)
-            await msg.delete()
-    except Exception:
-        pass
-    finally:
-        await delete_welcome_message(member.id)
+    async def update_welcome():
+        if not isinstance(msg, discord.Message):
+            return
+        status = "❎ Role Light dilepas." if had_role else "✅ Role Light diberikan."
+        new_embed = msg.embeds[0] if msg.embeds else discord.Embed(color=discord.Color.green())
+        new_embed.set_footer(text=status + " (pesan akan dihapus sebentar lagi)")
+        await msg.edit(embed=new_embed)
+        await msg.delete(delay=8)
+
+    async def send_intro():
+        intro_channel = guild.get_channel(guild_cfg(guild.id).intro_channel)
+        if isinstance(intro_channel, discord.TextChannel):
+            await outbox.send(
+                intro_channel,
+                f"Ekhem… {member.mention}! Sebutin umur kamu aja boleh kok. "
+                f"Kalau mau cerita lebih, juga boleh, ngga perlu terlalu detail, ya!",
+                priority=PRIO_NORMAL
+            )
+
+    effects = [update_welcome(), delete_welcome_message(binding.guild_id, member.id)]
+    if not had_role:
+        effects.append(send_intro())
+    for res in await asyncio.gather(*effects, return_exceptions=True):
+        if isinstance(res, Exception):
+            print("[WARN] welcome side effect:", res)
+
+@bot.event
+async def on_raw_reaction_add(payload: discord.RawReactionActionEvent):
+    binding = _lookup_binding(payload)
+    if binding is None:
+        return
+    guild = bot.get_guild(payload.guild_id)
+    if guild:
+        member_lru.put(payload.member)
+        await _apply_role(guild, payload.user_id, binding, add=True, member=payload.member)
+
+@bot.event
+async def on_raw_reaction_remove(payload: discord.RawReactionActionEvent):
+    binding = _lookup_binding(payload)
+    if binding is None or binding.owner_id is not None:
+        return
+    guild = bot.get_guild(payload.guild_id)
+    if guild:
+        await _apply_role(guild, payload.user_id, binding, add=False)
 
 # =========================
 # LOG PESAN DIHAPUS
 # =========================
 @bot.event
 async def on_message_delete(message: discord.Message):
-    if message.author.bot:
+    if message.author.bot or not message.guild:
         return
-    log_channel = bot.get_channel(CHANNEL_ID_LOGS)
+    log_channel = message.guild.get_channel(guild_cfg(message.guild.id).logs_channel)
     if not isinstance(log_channel, discord.TextChannel):
         return
     raw = (message.content or "")
+
+    # Loop sedang berat → kumpulkan dulu, kirim sebagai satu ringkasan
+    if loop_lag.level >= LOAD_DEGRADED:
+        _delete_digest.setdefault(log_channel.id, []).append(
+            f"• {message.author.mention} di {getattr(message.channel, 'mention', '?')}: "
+            f"{raw[:DIGEST_LINE_LIMIT].replace('`', '')}"
+        )
+        return
+
     konten = raw[:KONTEN_LIMIT] + ("..." if len(raw) > KONTEN_LIMIT else "")
     konten = konten.replace("```", "")
 
@@ -410,7 +1328,43 @@ async def on_message_delete(message: discord.Message):
         embed.add_field(name="Channel", value=message.channel.mention, inline=False)
     if konten.strip():
         embed.add_field(name="Konten", value=f"```{konten}```", inline=False)
-    await log_channel.send(embed=embed)
+    await outbox.send(log_channel, embed=embed, priority=PRIO_NORMAL)
+
+DIGEST_INTERVAL   = 60     # detik antar ringkasan log hapus saat mode hemat
+DIGEST_LINE_LIMIT = 80
+DIGEST_MAX_LINES  = 25
+
+_delete_digest: dict[int, List[str]] = {}    # log channel id → baris ringkasan
+
+async def flush_delete_digest():
+    pending = list(_delete_digest.items())
+    _delete_digest.clear()
+    for channel_id, lines in pending:
+        ch = bot.get_channel(channel_id)
+        if not isinstance(ch, discord.TextChannel) or not lines:
+            continue
+        shown = lines[:DIGEST_MAX_LINES]
+        desc = "\n".join(shown)
+        if len(lines) > len(shown):
+            desc += f"\n…dan {len(lines) - len(shown)} lainnya"
+        embed = discord.Embed(title=f"🗑️ Ringkasan {len(lines)} Pesan Dihapus (mode hemat)",
+                              description=desc[:4000], color=discord.Color.orange())
+        try:
+            await outbox.send(ch, embed=embed, priority=PRIO_NORMAL)
+        except Exception as e:
+            print("[WARN] flush_delete_digest:", e)
+
+async def delete_digest_loop():
+    while not bot.is_closed():
+        await asyncio.sleep(DIGEST_INTERVAL)
+        if _delete_digest:
+            await flush_delete_digest()
+
+def _on_load_change(prev: int, level: int):
+    if level == LOAD_NORMAL and _delete_digest:
+        asyncio.get_running_loop().create_task(flush_delete_digest())
+
+loop_lag.on_level_change(_on_load_change)
 
 # =========================
 # FORWARD GAMBAR DGN KONFIRMASI
@@ -427,15 +1381,167 @@ def _is_image_attachment(att: discord.Attachment) -> bool:
 def _jump_url(guild_id: int, channel_id: int, message_id: int) -> str:
     return f"https://discord.com/channels/{guild_id}/{channel_id}/{message_id}"
 
+MEDIA_DEDUP_MAX = int(os.getenv("MEDIA_DEDUP_MAX", "5000"))
+
+class MediaDedupIndex:
+    """
+    LRU (guild_id, key) → (channel_id, message_id) postingan Photo-Media.
+    key "m:{size}:{w}x{h}" dari metadata attachment (tanpa download, dicek sebelum prompt),
+    key "h:{sha256}" dari isi file (dicek saat forward, menangkap file yang di-encode ulang ukurannya sama).
+    """
+    def __init__(self, maxsize: int = MEDIA_DEDUP_MAX):
+        self.maxsize = maxsize
+        self._items: "OrderedDict[tuple[int, str], tuple[int, int]]" = OrderedDict()
+        self._by_message: dict[int, set] = {}
+
+    def __len__(self):
+        return len(self._items)
+
+    @staticmethod
+    def meta_key(att: discord.Attachment) -> Optional[str]:
+        if not att.width or not att.height:
+            return None
+        return f"m:{att.size}:{att.width}x{att.height}"
+
+    @staticmethod
+    def hash_key(data: bytes) -> str:
+        return "h:" + hashlib.sha256(data).hexdigest()
+
+    def get(self, guild_id: int, key: Optional[str]) -> Optional[tuple[int, int]]:
+        if key is None:
+            return None
+        hit = self._items.get((guild_id, key))
+        if hit is not None:
+            self._items.move_to_end((guild_id, key))
+        return hit
+
+    def put(self, guild_id: int, key: str, channel_id: int, message_id: int) -> List[Tuple[int, str]]:
+        """Simpan key; kembalikan entry yang terbuang (untuk dihapus dari Firestore)."""
+        self._drop((guild_id, key))
+        self._items[(guild_id, key)] = (channel_id, message_id)
+        self._by_message.setdefault(message_id, set()).add((guild_id, key))
+        evicted = []
+        while len(self._items) > self.maxsize:
+            old = next(iter(self._items))
+            self._drop(old)
+            evicted.append(old)
+        return evicted
+
+    def _drop(self, item: tuple[int, str]):
+        hit = self._items.pop(item, None)
+        if hit is None:
+            return
+        keys = self._by_message.get(hit[1])
+        if keys is not None:
+            keys.discard(item)
+            if not keys:
+                self._by_message.pop(hit[1], None)
+
+    def forget_message(self, message_id: int) -> List[Tuple[int, str]]:
+        """Postingan Photo-Media dihapus → semua key yang menunjuk ke sana ikut dibuang."""
+        items = list(self._by_message.pop(message_id, ()))
+        for item in items:
+            self._items.pop(item, None)
+        return items
+
+    def dump(self) -> List[list]:
+        return [[gid, key, cid, mid] for (gid, key), (cid, mid) in self._items.items()]
+
+media_index = MediaDedupIndex()
+
+def load_media_index():
+    for dat in sorted(load_media_forwards(), key=lambda d: d.get("updated", "")):
+        try:
+            media_index.put(int(dat["guild_id"]), str(dat["key"]), int(dat["channel_id"]), int(dat["message_id"]))
+        except (KeyError, TypeError, ValueError):
+            continue
+    print(f"🖼️ {len(media_index)} jejak forward media dimuat.")
+
+def remember_forward(guild_id: int, channel_id: int, message_id: int, keys: List[str]):
+    evicted = []
+    for key in keys:
+        evicted += media_index.put(guild_id, key, channel_id, message_id)
+    asyncio.create_task(asyncio.to_thread(save_media_forwards, guild_id, channel_id, message_id, keys))
+    if evicted:
+        asyncio.create_task(asyncio.to_thread(delete_media_forwards, evicted))
+
+@bot.listen("on_raw_message_delete")
+async def _forget_deleted_forward(payload: discord.RawMessageDeleteEvent):
+    items = media_index.forget_message(payload.message_id)
+    if items:
+        await asyncio.to_thread(delete_media_forwards, items)
+
+async def _forward_post_exists(guild: discord.Guild, channel_id: int, message_id: int) -> bool:
+    if discord.utils.get(bot.cached_messages, id=message_id):
+        return True
+    ch = guild.get_channel(channel_id)
+    if not isinstance(ch, discord.TextChannel):
+        return False
+    try:
+        await ch.fetch_message(message_id)
+        return True
+    except discord.NotFound:
+        return False
+    except Exception as e:
+        print("[WARN] cek postingan Photo-Media:", e)
+        return True     # gagal sementara → anggap masih ada, jangan buang index
+
+async def _live_hits(guild: discord.Guild, hits: List[Optional[tuple[int, int]]]) -> List[Optional[tuple[int, int]]]:
+    """
+    Postingan Photo-Media bisa dihapus saat bot offline → entry index jadi link mati.
+    Cek tiap postingan (cache / satu fetch per postingan); yang sudah hilang dibuang dari index.
+    """
+    dead = set()
+    for cid, mid in {h for h in hits if h}:
+        if not await _forward_post_exists(guild, cid, mid):
+            dead.add(mid)
+            items = media_index.forget_message(mid)
+            if items:
+                asyncio.create_task(asyncio.to_thread(delete_media_forwards, items))
+    return [None if h is None or h[1] in dead else h for h in hits]
+
+def _dup_links(guild_id: int, hits: List[tuple[int, int]]) -> str:
+    posts = list(dict.fromkeys(hits))      # urutan tetap, tanpa duplikat
+    if len(posts) == 1:
+        return f"[Media Photo]({_jump_url(guild_id, *posts[0])})"
+    return " ".join(f"[#{i}]({_jump_url(guild_id, *h)})" for i, h in enumerate(posts, start=1))
+
+async def _reply_already_forwarded(message: discord.Message, hits: List[tuple[int, int]], partial: bool = False):
+    n = len(hits)
+    what = "foto ini" if n == 1 else f"{n} foto ini"
+    tail = ". Sisanya aku tanyakan dulu ya." if partial else " kok~"
+    await outbox.send(
+        message.channel,
+        f"hola {message.author.mention}, {what} sudah pernah di-forward ke {_dup_links(message.guild.id, hits)}{tail}",
+        suppress_embeds=True,
+        delete_after=15,
+        priority=PRIO_LOW,
+        coalesce_key=("forward-dup", message.id)
+    )
+
 async def _confirm_and_forward_images(message: discord.Message):
-    if not message.guild or not message.attachments:
+    if not message.guild or not message.attachments or loop_lag.level >= LOAD_SHEDDING:
         return
     images = [att for att in message.attachments if _is_image_attachment(att)]
     if not images:
         return
 
-    prompt = await message.channel.send(
-        f"hola {message.author.mention}, apakah kamu ingin fotonya aku forward ke **Channel Photo-Media**?"
+    # Dedup sebelum prompt: gambar yang metadatanya sudah tercatat tidak ditanyakan lagi
+    guild_id = message.guild.id
+    hits = [media_index.get(guild_id, MediaDedupIndex.meta_key(att)) for att in images]
+    if any(hits):
+        hits = await _live_hits(message.guild, hits)
+    known = [h for h in hits if h]
+    if known and len(known) == len(images):
+        return await _reply_already_forwarded(message, known)
+    if known:
+        await _reply_already_forwarded(message, known, partial=True)
+    images = [att for att, hit in zip(images, hits) if hit is None]
+
+    prompt = await outbox.send(
+        message.channel,
+        f"hola {message.author.mention}, apakah kamu ingin fotonya aku forward ke **Channel Photo-Media**?",
+        priority=PRIO_NORMAL
     )
     async def timeout_cleanup():
         await asyncio.sleep(30)
@@ -456,39 +1562,66 @@ async def _confirm_and_forward_images(message: discord.Message):
         try: await prompt.delete()
         except Exception: pass
     except asyncio.TimeoutError:
-        await message.channel.send("⏰ Konfirmasi habis. Forward dibatalkan.", delete_after=6)
+        await outbox.send(message.channel, "⏰ Konfirmasi habis. Forward dibatalkan.", delete_after=6,
+                          priority=PRIO_LOW, coalesce_key=("forward-timeout", message.author.id))
         return
 
     if str(reaction.emoji) == "❌":
-        await message.channel.send("❌ Oke, tidak di-forward.", delete_after=5)
+        await outbox.send(message.channel, "❌ Oke, tidak di-forward.", delete_after=5, priority=PRIO_LOW)
         return
 
     try:
-        dest = bot.get_channel(CHANNEL_ID_PHOTO_MEDIA)
+        dest = message.guild.get_channel(guild_cfg(message.guild.id).photo_media_channel)
         if not isinstance(dest, discord.TextChannel):
-            return await message.channel.send("⚠️ Channel Photo-Media tidak ditemukan.", delete_after=6)
+            return await outbox.send(message.channel, "⚠️ Channel Photo-Media tidak ditemukan.", delete_after=6,
+                                     priority=PRIO_LOW)
         caption = message.clean_content.strip()
         prefix = f"media dari {message.author.mention}"
         content = f"{prefix}\n{caption}" if caption else prefix
 
-        files = []
+        files, keys, dups = [], [], []
         for att in images[:10]:
             try:
-                files.append(await att.to_file())
+                data = await att.read()
             except Exception as e:
-                print("[WARN] to_file:", e)
+                print("[WARN] read attachment:", e)
+                continue
+            hkey = MediaDedupIndex.hash_key(data)
+            hit = media_index.get(guild_id, hkey)
+            if hit is not None:
+                hit = (await _live_hits(message.guild, [hit]))[0]
+            if hit is not None:
+                # isi sama, metadata beda → catat metadata ini juga supaya lain kali tidak ditanya
+                mkey = MediaDedupIndex.meta_key(att)
+                if mkey:
+                    remember_forward(guild_id, hit[0], hit[1], [mkey])
+                dups.append(hit)
+                continue
+            files.append(discord.File(io.BytesIO(data), att.filename, spoiler=att.is_spoiler()))
+            keys += [k for k in (hkey, MediaDedupIndex.meta_key(att)) if k]
 
-        sent = await dest.send(content=content, files=files) if files else await dest.send(content)
+        if not files:
+            if dups:
+                return await _reply_already_forwarded(message, dups)
+            return
+
+        sent = await outbox.send(dest, content, files=files, priority=PRIO_NORMAL)
+        if sent:
+            remember_forward(guild_id, dest.id, sent.id, keys)
         jump = _jump_url(message.guild.id, dest.id, sent.id) if sent else ""
-        await message.channel.send(
+        await outbox.send(
+            message.channel,
             f"Ekhem.. media {message.author.mention} udah aku forward ke "
-            f"[Media Photo]({jump}), cuss lihat~",
+            f"[Media Photo]({jump}), cuss lihat~"
+            + (f"\n({len(dups)} foto lainnya sudah ada di {_dup_links(guild_id, dups)})" if dups else ""),
             suppress_embeds=True,
-            delete_after=10
+            delete_after=10,
+            priority=PRIO_LOW
         )
     except Exception as e:
         print("[ERROR] forward foto:", e)
-        await message.channel.send("⚠️ Terjadi kendala saat forward media.", delete_after=6)
+        await outbox.send(message.channel, "⚠️ Terjadi kendala saat forward media.", delete_after=6,
+                          priority=PRIO_LOW)
 
 # =========================
 # DOWNLOADER (API: dl.siputzx.my.id) + CAROUSEL IG
@@ -520,18 +1653,90 @@ class DlActionView(discord.ui.View):
         except Exception:
             await interaction.response.send_message("❌ Gagal menutup thread.", ephemeral=True)
 
+DL_THREAD_IDLE_MINUTES = int(os.getenv("DL_THREAD_IDLE_MINUTES", "60"))   # archive thread setelah idle
+DL_SWEEP_INTERVAL      = 300                                              # detik antar sweep
+
+_dl_threads: dict[tuple[int, int], int] = {}     # (guild_id, user_id) → thread_id
+_dl_thread_activity: dict[int, float] = {}       # thread_id → epoch aktivitas terakhir
+
+def load_thread_index():
+    _dl_threads.clear()
+    _dl_threads.update(load_downloader_threads())
+    # aktivitas sebelum restart tidak diketahui → mulai hitung idle dari sekarang
+    now = time.time()
+    for thread_id in _dl_threads.values():
+        _dl_thread_activity[thread_id] = now
+    print(f"🧵 {len(_dl_threads)} thread downloader dimuat dari Firestore.")
+
+def touch_thread(thread_id: int):
+    _dl_thread_activity[thread_id] = time.time()
+
+async def _resolve_thread(guild: discord.Guild, thread_id: int) -> Optional[discord.Thread]:
+    th = guild.get_thread(thread_id)          # hanya thread aktif yg ada di cache
+    if th is None:
+        try:
+            th = await bot.fetch_channel(thread_id)
+        except Exception:
+            return None
+    return th if isinstance(th, discord.Thread) else None
+
 async def ensure_private_thread(channel: discord.TextChannel, user: discord.Member) -> discord.Thread:
+    """Pakai ulang thread milik user (unarchive kalau perlu); buat baru hanya jika belum ada / sudah dihapus."""
+    key = (channel.guild.id, user.id)
+    thread_id = _dl_threads.get(key)
+    if thread_id:
+        th = await _resolve_thread(channel.guild, thread_id)
+        if th and th.parent_id == channel.id:
+            try:
+                if th.archived or th.locked:
+                    await th.edit(archived=False, locked=False)
+                # user bisa saja sudah keluar dari thread yang masih aktif; add_user idempoten
+                await th.add_user(user)
+                touch_thread(th.id)
+                return th
+            except Exception as e:
+                print("[WARN] reopen thread:", e)
+        _dl_threads.pop(key, None)
+        _dl_thread_activity.pop(thread_id, None)
+        delete_downloader_thread(*key)
+
     name = f"DL-{user.display_name}".strip()[:80]
     th = await channel.create_thread(name=name, type=discord.ChannelType.private_thread, invitable=False)
     try:
         await th.add_user(user)
     except Exception:
         pass
+    _dl_threads[key] = th.id
+    touch_thread(th.id)
+    save_downloader_thread(channel.guild.id, user.id, th.id)
     return th
 
-async def post_siputzx(link: str) -> tuple[dict | None, str | None]:
-    """Auto deteksi TikTok / Instagram lalu POST ke API dl.siputzx.my.id"""
-    headers = {"Accept": "application/json", "Content-Type": "application/json"}
+async def downloader_thread_sweeper():
+    """Archive thread downloader yang idle lebih dari DL_THREAD_IDLE_MINUTES."""
+    while not bot.is_closed():
+        await asyncio.sleep(DL_SWEEP_INTERVAL)
+        cutoff = time.time() - DL_THREAD_IDLE_MINUTES * 60
+        for thread_id, last in list(_dl_thread_activity.items()):
+            if last > cutoff:
+                continue
+            _dl_thread_activity.pop(thread_id, None)
+            th = bot.get_channel(thread_id)
+            if not isinstance(th, discord.Thread) or th.archived:
+                continue
+            try:
+                await th.edit(archived=True)
+            except Exception as e:
+                print("[WARN] archive thread idle:", e)
+
+RESOLVER_URLS = [u.strip() for u in os.getenv("DL_RESOLVER_URLS", "https://dl.siputzx.my.id/").split(",") if u.strip()]
+RESOLVER_TIMEOUT       = 30.0    # batas per backend
+HEDGE_MIN_DELAY        = 2.0     # jangan hedge lebih cepat dari ini
+HEDGE_MAX_DELAY        = 8.0
+BREAKER_FAIL_THRESHOLD = 3       # gagal beruntun → circuit open
+BREAKER_COOLDOWN       = 60.0    # detik sebelum boleh dicoba lagi (half-open)
+
+def _resolver_payload(link: str) -> dict:
+    """Payload API ala dl.siputzx.my.id (cobalt-compatible)."""
     payload = {"url": link}
     if "tiktok" in link:
         payload["videoQuality"] = "1080"
@@ -539,15 +1744,160 @@ async def post_siputzx(link: str) -> tuple[dict | None, str | None]:
     elif "instagram" in link:
         payload["videoQuality"] = "720"
         payload["audioFormat"] = "mp3"
+    return payload
+
+class CircuitBreaker:
+    def __init__(self, threshold: int = BREAKER_FAIL_THRESHOLD, cooldown: float = BREAKER_COOLDOWN):
+        self.threshold = threshold
+        self.cooldown = cooldown
+        self.failures = 0
+        self.opened_at: Optional[float] = None
+        self.probing = False        # half-open: satu request percobaan sedang berjalan
+
+    @property
+    def state(self) -> str:
+        if self.opened_at is None:
+            return "closed"
+        return "half-open" if time.monotonic() - self.opened_at >= self.cooldown else "open"
+
+    def allow(self) -> bool:
+        state = self.state
+        return state == "closed" or (state == "half-open" and not self.probing)
+
+    def acquire(self) -> bool:
+        """Dipanggil tepat sebelum request; saat half-open hanya satu request yang lolos."""
+        if not self.allow():
+            return False
+        if self.state == "half-open":
+            self.probing = True
+        return True
 
-    try:
-        async with httpx.AsyncClient(timeout=30) as client:
-            resp = await client.post("https://dl.siputzx.my.id/", headers=headers, json=payload)
+    def release(self):
+        """Request percobaan dibatalkan tanpa hasil (mis. kalah hedge)."""
+        self.probing = False
+
+    def record_success(self):
+        self.failures = 0
+        self.opened_at = None
+        self.probing = False
+
+    def record_failure(self):
+        self.probing = False
+        self.failures += 1
+        if self.state == "half-open" or self.failures >= self.threshold:
+            self.opened_at = time.monotonic()
+
+class ResolverBackend:
+    """Satu upstream resolver + statistik latency (EWMA) + circuit breaker."""
+    def __init__(self, name: str, url: str, timeout: float = RESOLVER_TIMEOUT):
+        self.name = name
+        self.url = url
+        self.timeout = timeout
+        self.breaker = CircuitBreaker()
+        self.latency_ewma: Optional[float] = None
+        self.calls = 0
+        self.errors = 0
+
+    def observe(self, seconds: float):
+        self.latency_ewma = seconds if self.latency_ewma is None else 0.8 * self.latency_ewma + 0.2 * seconds
+
+    def hedge_delay(self) -> float:
+        if self.latency_ewma is None:
+            return HEDGE_MIN_DELAY * 1.5
+        return min(HEDGE_MAX_DELAY, max(HEDGE_MIN_DELAY, self.latency_ewma * 2))
+
+    async def fetch(self, client: httpx.AsyncClient, link: str) -> tuple[dict | None, str | None]:
+        headers = {"Accept": "application/json", "Content-Type": "application/json"}
+        resp = await client.post(self.url, headers=headers, json=_resolver_payload(link), timeout=self.timeout)
         if resp.status_code != 200:
             return None, f"HTTP {resp.status_code}"
         return resp.json(), None
-    except Exception as e:
-        return None, str(e)
+
+class LinkResolver:
+    """
+    Resolve link sosial lewat beberapa backend:
+    - urutkan backend sehat menurut latency,
+    - kalau backend pertama lambat (> hedge_delay), kirim request cadangan ke backend berikutnya,
+    - backend yang gagal beruntun di-skip (circuit open) sampai cooldown lewat.
+    """
+    def __init__(self, backends: List[ResolverBackend]):
+        self.backends = backends
+        self._client: Optional[httpx.AsyncClient] = None
+
+    def _get_client(self) -> httpx.AsyncClient:
+        if self._client is None or self._client.is_closed:
+            self._client = httpx.AsyncClient(timeout=RESOLVER_TIMEOUT)
+        return self._client
+
+    def _candidates(self) -> List[ResolverBackend]:
+        healthy = [b for b in self.backends if b.breaker.allow()]
+        # backend tanpa data latency dianggap cepat supaya sempat diukur
+        return sorted(healthy, key=lambda b: b.latency_ewma or 0.0)
+
+    async def _call(self, backend: ResolverBackend, link: str) -> tuple[dict | None, str | None]:
+        if not backend.breaker.acquire():
+            return None, f"{backend.name}: circuit open"
+        backend.calls += 1
+        t0 = time.monotonic()
+        try:
+            data, err = await backend.fetch(self._get_client(), link)
+        except asyncio.CancelledError:
+            # kalah hedge: bukan kegagalan, tapi waktu tunggunya batas bawah latency backend ini →
+            # backend yang tadinya cepat lalu melambat tidak terus-terusan jadi pilihan pertama
+            backend.observe(time.monotonic() - t0)
+            backend.breaker.release()
+            raise
+        except Exception as e:
+            data, err = None, str(e) or e.__class__.__name__
+        backend.observe(time.monotonic() - t0)
+        if data is None:
+            backend.errors += 1
+            backend.breaker.record_failure()
+            return None, f"{backend.name}: {err}"
+        backend.breaker.record_success()
+        return data, None
+
+    async def resolve(self, link: str) -> tuple[dict | None, str | None]:
+        candidates = self._candidates()
+        if not candidates:
+            return None, "semua server downloader sedang bermasalah, coba lagi nanti"
+
+        pending: dict[asyncio.Task, ResolverBackend] = {}
+        errors: List[str] = []
+        next_idx = 0
+
+        def launch():
+            nonlocal next_idx
+            backend = candidates[next_idx]
+            next_idx += 1
+            pending[asyncio.create_task(self._call(backend, link))] = backend
+
+        launch()
+        try:
+            while pending:
+                hedge_timeout = None
+                if next_idx < len(candidates):
+                    hedge_timeout = min(b.hedge_delay() for b in pending.values())
+                done, _ = await asyncio.wait(pending, timeout=hedge_timeout, return_when=asyncio.FIRST_COMPLETED)
+                if not done:
+                    launch()          # hedge: backend pertama lambat
+                    continue
+                for task in done:
+                    pending.pop(task)
+                    data, err = task.result()
+                    if data is not None:
+                        return data, None
+                    errors.append(err)
+                if next_idx < len(candidates):
+                    launch()          # failover langsung
+        finally:
+            for task in pending:
+                task.cancel()
+        return None, "; ".join(errors)
+
+link_resolver = LinkResolver([
+    ResolverBackend(f"backend{i + 1}", url) for i, url in enumerate(RESOLVER_URLS)
+])
 
 def _headers_for_url(url: str) -> dict:
     ref = "https://dl.siputzx.my.id/"
@@ -563,24 +1913,131 @@ def _headers_for_url(url: str) -> dict:
         "Accept": "*/*"
     }
 
-async def download_bytes(url: str, max_bytes: int = 25_000_000) -> tuple[bytes | None, bool]:
-    try:
-        async with aiohttp.ClientSession() as session:
-            async with session.get(url, headers=_headers_for_url(url), timeout=aiohttp.ClientTimeout(total=90)) as r:
-                if r.status != 200:
-                    print(f"[download] {r.status} {url[:80]}")
+DL_RANGE_PARTS     = int(os.getenv("DL_RANGE_PARTS", "4"))   # koneksi paralel per file
+DL_RANGE_MIN_BYTES = 4 * 1024 * 1024                          # file lebih kecil → satu stream saja
+DL_PART_RETRIES    = 3
+DL_TOTAL_TIMEOUT   = 90
+DL_CHUNK           = 256 * 1024
+
+_CONTENT_RANGE = re.compile(r"bytes\s+(\d+)-(\d+)/(\d+|\*)")
+
+class _PartFailed(Exception):
+    pass
+
+class MediaDownloader:
+    """
+    Unduh media CDN lewat session + connection pool bersama.
+    Kalau server mendukung Range dan file cukup besar, file dipecah jadi beberapa bagian
+    yang diunduh paralel langsung ke buffer yang sudah dialokasikan; bagian yang gagal
+    diulang sendiri (lanjut dari byte terakhir). Selain itu → satu stream seperti biasa.
+    """
+    def __init__(self, parts: int = DL_RANGE_PARTS):
+        self.parts = max(1, parts)
+        self._session: Optional[aiohttp.ClientSession] = None
+
+    def _get_session(self) -> aiohttp.ClientSession:
+        if self._session is None or self._session.closed:
+            connector = aiohttp.TCPConnector(limit=32, limit_per_host=self.parts * 2, ttl_dns_cache=300)
+            self._session = aiohttp.ClientSession(
+                connector=connector,
+                timeout=aiohttp.ClientTimeout(total=None, sock_connect=15, sock_read=30),
+            )
+        return self._session
+
+    async def close(self):
+        if self._session is not None and not self._session.closed:
+            await self._session.close()
+
+    async def _probe(self, url: str) -> tuple[int | None, bool]:
+        """(ukuran file, mendukung range?) lewat GET bytes=0-0 — lebih andal dari HEAD di URL CDN bertanda tangan."""
+        headers = {**_headers_for_url(url), "Range": "bytes=0-0"}
+        async with self._get_session().get(url, headers=headers) as r:
+            if r.status == 206:
+                m = _CONTENT_RANGE.match(r.headers.get("Content-Range", ""))
+                if m and m.group(3) != "*":
+                    return int(m.group(3)), True
+            if r.status == 200 and r.content_length is not None:
+                return r.content_length, False
+        return None, False
+
+    async def _fetch_part(self, url: str, buf: memoryview, start: int, end: int):
+        pos = start
+        for attempt in range(DL_PART_RETRIES):
+            headers = {**_headers_for_url(url), "Range": f"bytes={pos}-{end}"}
+            try:
+                async with self._get_session().get(url, headers=headers) as r:
+                    if r.status != 206:
+                        raise _PartFailed(f"HTTP {r.status} untuk range {pos}-{end}")
+                    async for chunk in r.content.iter_chunked(DL_CHUNK):
+                        n = min(len(chunk), end + 1 - pos)
+                        buf[pos:pos + n] = chunk[:n]
+                        pos += n
+                if pos > end:
+                    return
+            except _PartFailed:
+                raise
+            except (aiohttp.ClientError, asyncio.TimeoutError) as e:
+                print(f"[download] part {start}-{end} percobaan {attempt + 1}: {e or e.__class__.__name__}")
+            await asyncio.sleep(0.5 * (attempt + 1))
+        raise _PartFailed(f"range {start}-{end} gagal setelah {DL_PART_RETRIES} percobaan")
+
+    async def _ranged(self, url: str, size: int) -> bytes:
+        buf = bytearray(size)
+        view = memoryview(buf)
+        step = -(-size // self.parts)
+        parts = [(off, min(off + step, size) - 1) for off in range(0, size, step)]
+        tasks = [asyncio.create_task(self._fetch_part(url, view, a, b)) for a, b in parts]
+        try:
+            await asyncio.gather(*tasks)
+        finally:
+            for t in tasks:
+                t.cancel()
+            view.release()
+        return bytes(buf)
+
+    async def _single(self, url: str, max_bytes: int) -> tuple[bytes | None, bool]:
+        async with self._get_session().get(url, headers=_headers_for_url(url)) as r:
+            if r.status != 200:
+                print(f"[download] {r.status} {url[:80]}")
+                return None, True
+            if r.content_length is not None and r.content_length > max_bytes:
+                return None, True
+            total = 0
+            buff = io.BytesIO()
+            async for chunk in r.content.iter_chunked(DL_CHUNK):
+                total += len(chunk)
+                if total > max_bytes:
                     return None, True
-                total = 0
-                buff = io.BytesIO()
-                async for chunk in r.content.iter_chunked(256 * 1024):
-                    total += len(chunk)
-                    if total > max_bytes:
-                        return None, True
-                    buff.write(chunk)
-                return buff.getvalue(), False
-    except Exception as e:
-        print("[download] error:", e)
-        return None, True
+                buff.write(chunk)
+            return buff.getvalue(), False
+
+    async def _download(self, url: str, max_bytes: int) -> tuple[bytes | None, bool]:
+        size, ranged = None, False
+        if self.parts > 1:
+            try:
+                size, ranged = await self._probe(url)
+            except (aiohttp.ClientError, asyncio.TimeoutError) as e:
+                print("[download] probe gagal:", e or e.__class__.__name__)
+        if size is not None and size > max_bytes:
+            return None, True       # tidak perlu diunduh sama sekali
+        if ranged and size >= DL_RANGE_MIN_BYTES:
+            try:
+                return await self._ranged(url, size), False
+            except _PartFailed as e:
+                print(f"[download] ranged gagal ({e}), fallback satu stream")
+        return await self._single(url, max_bytes)
+
+    async def download(self, url: str, max_bytes: int = 25_000_000) -> tuple[bytes | None, bool]:
+        try:
+            return await asyncio.wait_for(self._download(url, max_bytes), DL_TOTAL_TIMEOUT)
+        except Exception as e:
+            print("[download] error:", e or e.__class__.__name__)
+            return None, True
+
+media_downloader = MediaDownloader()
+
+async def download_bytes(url: str, max_bytes: int = 25_000_000) -> tuple[bytes | None, bool]:
+    return await media_downloader.download(url, max_bytes)
 
 async def send_media_or_link(thread: discord.Thread, author: discord.Member, url: str, filename: str):
     content, fail = await download_bytes(url)
@@ -593,7 +2050,7 @@ async def send_media_or_link(thread: discord.Thread, author: discord.Member, url
 async def process_download_in_thread(thread: discord.Thread, author: discord.Member, link: str):
     await thread.send("⏳ Sedang mengambil media dari tautan...")
 
-    data, err = await post_siputzx(link)
+    data, err = await link_resolver.resolve(link)
     if not data:
         await thread.send(f"❌ Gagal ambil data: {err}", view=DlActionView(thread, author.id))
         return
@@ -627,31 +2084,40 @@ async def process_download_in_thread(thread: discord.Thread, author: discord.Mem
 async def on_message(message: discord.Message):
     if message.author.bot:
         return
+    member_lru.put(message.author)
+    cfg = guild_cfg(message.guild.id if message.guild else None)
 
-    # A) Deteksi link di CHANNEL_ID_LINK_DETECT → arahkan ke downloader (hapus 5 menit)
-    if message.channel.id == CHANNEL_ID_LINK_DETECT:
+    # A) Deteksi link di link_detect_channel → arahkan ke downloader (hapus 5 menit)
+    if message.channel.id == cfg.link_detect_channel and loop_lag.level < LOAD_DEGRADED:
         if URL_ANY.search(message.content):
-            ch = bot.get_channel(CHANNEL_ID_DOWNLOADER)
+            ch = message.guild.get_channel(cfg.downloader_channel)
             if isinstance(ch, discord.TextChannel):
-                tip = await message.reply(
-                    f"hola {message.author.mention}, mau download medianya? ke {ch.mention} yuk!",
-                    mention_author=True
-                )
                 try:
-                    await tip.delete(delay=300)
-                except Exception:
-                    pass
+                    await outbox.send(
+                        message.channel,
+                        f"hola {message.author.mention}, mau download medianya? ke {ch.mention} yuk!",
+                        reference=message,
+                        mention_author=True,
+                        delete_after=300,
+                        priority=PRIO_LOW,
+                        coalesce_key=("link-tip", message.author.id)
+                    )
+                except Exception as e:
+                    print("[WARN] link tip:", e)
 
     # B) Downloader channel: kalau user kirim link langsung → hapus & minta pakai !dw
-    if message.channel.id == CHANNEL_ID_DOWNLOADER and not isinstance(message.channel, discord.Thread):
+    if message.channel.id == cfg.downloader_channel and not isinstance(message.channel, discord.Thread):
         if URL_ANY.search(message.content):
             try:
                 await message.delete()
             except Exception:
                 pass
-            await message.channel.send(
+            await outbox.send(
+                message.channel,
                 f"{message.author.mention} demi privasi, gunakan perintah **`!dw`** dulu untuk membuat thread privat, ya.",
-                delete_after=30
+                delete_after=30,
+                priority=PRIO_LOW,
+                coalesce_key=("dw-notice", message.author.id)
             )
 
     # C) Deteksi !mabar / !main (manual)
@@ -675,15 +2141,16 @@ async def on_message(message: discord.Message):
     # F) Jika di private thread di bawah downloader → proses link apa saja
     if isinstance(message.channel, discord.Thread):
         parent = message.channel.parent
-        if parent and parent.id == CHANNEL_ID_DOWNLOADER:
+        if parent and parent.id == cfg.downloader_channel:
+            touch_thread(message.channel.id)
             url_m = URL_ANY.search(message.content or "")
             if not url_m:
                 return
-            role_light = message.guild.get_role(ROLE_ID_LIGHT) if message.guild else None
+            role_light = message.guild.get_role(cfg.light_role)
             if not role_light or role_light not in message.author.roles:
                 await message.channel.send("❌ Hanya member dengan role 🔆 Light yang bisa memakai fitur ini.")
                 return
-            if not get_downloader_enabled(message.guild.id):
+            if not cfg.downloader_on:
                 await message.channel.send("⛔ Fitur downloader sedang non-aktif oleh admin.")
                 return
             await process_download_in_thread(message.channel, message.author, url_m.group(1))
@@ -693,35 +2160,141 @@ async def on_message(message: discord.Message):
 # =========================
 @bot.command()
 async def ping(ctx: commands.Context):
-    await ctx.send(f"Pong! {round(bot.latency * 1000)}ms")
+    await ctx.send(
+        f"Pong! {round(bot.latency * 1000)}ms · loop lag {loop_lag.ewma_ms:.0f}ms "
+        f"(level {loop_lag.level})"
+    )
 
 # ---- Downloader switches (ADMIN) ----
 @bot.command(name="downloader")
 @commands.has_permissions(administrator=True)
 async def downloader_cmd(ctx: commands.Context, mode: str):
-    """!downloader on | off  (status disimpan di config/downloader)"""
+    """!downloader on | off  (status disimpan di guild_config/<guild_id>)"""
     mode = mode.lower().strip()
-    if ctx.channel.id != CHANNEL_ID_LOGS:
+    if ctx.guild is None or ctx.channel.id != guild_cfg(ctx.guild.id).logs_channel:
         return await ctx.send("Perintah ini hanya di channel moderator/log.", delete_after=8)
     if mode not in {"on", "off"}:
         return await ctx.send("Gunakan: `!downloader on` atau `!downloader off`", delete_after=8)
 
-    set_downloader_status(mode == "on")
+    set_downloader_status(ctx.guild.id, mode == "on")
     await ctx.send(f"✅ Downloader di-{'aktifkan' if mode == 'on' else 'nonaktifkan'}.", delete_after=8)
-    await ensure_downloader_notice()
+    await ensure_downloader_notice(ctx.guild)
+
+@bot.command(name="stats")
+@commands.has_permissions(manage_guild=True)
+async def stats_cmd(ctx: commands.Context):
+    """Ringkasan memori, cache member, waktu startup & lag event loop."""
+    if ctx.guild is None or ctx.channel.id != guild_cfg(ctx.guild.id).logs_channel:
+        return await ctx.send("Perintah ini hanya di channel moderator/log.", delete_after=8)
+    uptime = time.perf_counter() - BOOT_T0
+    await ctx.send(
+        f"📈 {len(bot.guilds)} guild · uptime {uptime / 3600:.1f} jam\n"
+        f"{member_cache_report()}\n"
+        f"loop lag {loop_lag.ewma_ms:.0f}ms (level {loop_lag.level})",
+        delete_after=60
+    )
+
+# ---- Konfigurasi per guild (ADMIN) ----
+@bot.command(name="config")
+@commands.has_permissions(administrator=True)
+async def config_cmd(ctx: commands.Context, action: str = "show", key: str = "", value: str = ""):
+    """
+    !config show
+    !config set <key> <#channel | @role | id>
+    Bisa dipakai di channel mana pun (guild baru belum punya channel log).
+    """
+    if ctx.guild is None:
+        return
+    cfg = guild_cfg(ctx.guild.id)
+    action = action.lower().strip()
+
+    if action == "show":
+        lines = [f"`{k}` → <#{getattr(cfg, k)}>" for k in GUILD_CHANNEL_KEYS]
+        lines += [f"`{k}` → <@&{getattr(cfg, k)}>" for k in GUILD_ROLE_KEYS]
+        lines.append(f"`downloader` → {'on' if cfg.downloader_on else 'off'}")
+        return await ctx.send("\n".join(lines), allowed_mentions=discord.AllowedMentions.none())
+
+    key = key.lower().strip()
+    new_id = _as_id(re.sub(r"[<#@&>]", "", value), 0)
+    if action != "set" or key not in {**GUILD_CHANNEL_KEYS, **GUILD_ROLE_KEYS} or not new_id:
+        return await ctx.send("Gunakan: `!config show` atau `!config set <key> <#channel|@role|id>`", delete_after=10)
+    if key in GUILD_CHANNEL_KEYS and ctx.guild.get_channel(new_id) is None:
+        return await ctx.send("Channel tidak ditemukan di server ini.", delete_after=8)
+    if key in GUILD_ROLE_KEYS and ctx.guild.get_role(new_id) is None:
+        return await ctx.send("Role tidak ditemukan di server ini.", delete_after=8)
+
+    setattr(cfg, key, new_id)
+    save_guild_config(ctx.guild.id, **{key: new_id})
+    await ctx.send(f"✅ `{key}` diset.", delete_after=8)
+    if key == "downloader_channel":
+        await ensure_downloader_notice(ctx.guild)
+
+# ---- Reaction-role menu (ADMIN) ----
+MESSAGE_LINK = re.compile(r"discord(?:app)?\.com/channels/(\d+)/(\d+)/(\d+)")
+
+@bot.command(name="rr")
+@commands.has_permissions(manage_roles=True)
+async def reaction_role_cmd(ctx: commands.Context, action: str, target: str = "", emoji: str = "",
+                            role: Optional[discord.Role] = None):
+    """
+    !rr add <link pesan> <emoji> @role   → pasang menu role di pesan tsb
+    !rr remove <link pesan> <emoji>
+    !rr list
+    """
+    if ctx.guild is None or ctx.channel.id != guild_cfg(ctx.guild.id).logs_channel:
+        return await ctx.send("Perintah ini hanya di channel moderator/log.", delete_after=8)
+    action = action.lower().strip()
+
+    if action == "list":
+        menus = [b for b in _reaction_roles.values() if b.owner_id is None and b.guild_id == ctx.guild.id]
+        if not menus:
+            return await ctx.send("Belum ada reaction-role menu.", delete_after=15)
+        lines = [f"{b.emoji} → <@&{b.role_id}> di {_jump_url(b.guild_id, b.channel_id, b.message_id)}" for b in menus]
+        return await ctx.send("\n".join(lines)[:1900], suppress_embeds=True, allowed_mentions=discord.AllowedMentions.none())
+
+    m = MESSAGE_LINK.search(target)
+    if action not in {"add", "remove"} or not m or not emoji or (action == "add" and role is None):
+        return await ctx.send("Gunakan: `!rr add <link pesan> <emoji> @role`, `!rr remove <link pesan> <emoji>`, `!rr list`",
+                              delete_after=10)
+    guild_id, channel_id, message_id = (int(x) for x in m.groups())
+    if guild_id != ctx.guild.id:
+        return await ctx.send("Pesan harus berada di server ini.", delete_after=8)
+
+    channel = ctx.guild.get_channel_or_thread(channel_id)
+    if action == "add":
+        if role >= ctx.guild.me.top_role:
+            return await ctx.send("Role itu lebih tinggi dari role bot.", delete_after=8)
+        register_binding(ReactionBinding(guild_id, channel_id, message_id, emoji, role.id))
+        if isinstance(channel, (discord.TextChannel, discord.Thread)):
+            try:
+                await channel.get_partial_message(message_id).add_reaction(emoji)
+            except Exception as e:
+                print("[WARN] rr add_reaction:", e)
+    else:
+        binding = _reaction_roles.get((message_id, emoji))
+        if binding is None or binding.owner_id is not None:
+            return await ctx.send("Binding tidak ditemukan.", delete_after=8)
+        del _reaction_roles[binding.key]
+
+    save_reaction_menu(message_id, guild_id, channel_id,
+                       [{"emoji": b.emoji, "role_id": b.role_id} for b in menu_bindings(message_id)])
+    await ctx.send(f"✅ Reaction-role {'dipasang' if action == 'add' else 'dilepas'}.", delete_after=8)
 
 # ---- Mulai sesi download privat ----
 @bot.command(name="dw")
 async def dw(ctx: commands.Context):
     """Mulai sesi download (buat thread privat). Pesan perintah dihapus setelah 30 detik."""
-    if ctx.channel.id != CHANNEL_ID_DOWNLOADER:
-        return await ctx.send(f"Fitur ini hanya di <#{CHANNEL_ID_DOWNLOADER}> ya.", delete_after=7)
+    if ctx.guild is None:
+        return
+    cfg = guild_cfg(ctx.guild.id)
+    if ctx.channel.id != cfg.downloader_channel:
+        return await ctx.send(f"Fitur ini hanya di <#{cfg.downloader_channel}> ya.", delete_after=7)
 
-    role_light = ctx.guild.get_role(ROLE_ID_LIGHT)
+    role_light = ctx.guild.get_role(cfg.light_role)
     if not role_light or role_light not in ctx.author.roles:
         return await ctx.send("❌ Hanya member dengan role 🔆 Light yang bisa memakai fitur ini.", delete_after=7)
 
-    if not get_downloader_enabled(ctx.guild.id):
+    if not cfg.downloader_on:
         return await ctx.send("⛔ Fitur downloader sedang non-aktif oleh admin.", delete_after=7)
 
     thread = await ensure_private_thread(ctx.channel, ctx.author)
@@ -736,85 +2309,424 @@ async def dw(ctx: commands.Context):
     except Exception:
         pass
 
-# ---------- ANNOUNCE (dari moderator/log ke server spotlight) ----------
+# ---------- PROFILER (ADMIN) ----------
+PROFILE_MAX_SECONDS = 120
+HANDLER_SAMPLE_KEEP = 2000    # durasi per handler yang disimpan untuk persentil
+
+class HandlerStats:
+    __slots__ = ("calls", "errors", "wall", "busy", "samples")
+
+    def __init__(self):
+        self.calls = 0
+        self.errors = 0
+        self.wall = 0.0       # total waktu dari mulai sampai selesai
+        self.busy = 0.0       # waktu benar-benar jalan di event loop (sisanya = menunggu I/O / sleep)
+        self.samples: deque = deque(maxlen=HANDLER_SAMPLE_KEEP)
+
+    def record(self, wall: float, busy: float, failed: bool):
+        self.calls += 1
+        self.errors += failed
+        self.wall += wall
+        self.busy += busy
+        self.samples.append(wall)
+
+    def percentile(self, q: float) -> float:
+        if not self.samples:
+            return 0.0
+        ordered = sorted(self.samples)
+        return ordered[min(len(ordered) - 1, int(q * len(ordered)))]
+
+@types.coroutine
+def _timed_await(coro, stats: HandlerStats):
+    """Jalankan coroutine step-by-step; waktu tiap step = busy, jeda antar step = menunggu."""
+    start = time.perf_counter()
+    busy = 0.0
+    failed = True
+    send_val, throw_exc = None, None
+    try:
+        while True:
+            t0 = time.perf_counter()
+            try:
+                if throw_exc is not None:
+                    exc, throw_exc = throw_exc, None
+                    yielded = coro.throw(exc)
+                else:
+                    yielded = coro.send(send_val)
+            except StopIteration as stop:
+                failed = False
+                return stop.value
+            finally:
+                busy += time.perf_counter() - t0
+            try:
+                send_val = yield yielded
+            except BaseException as e:
+                send_val, throw_exc = None, e
+    finally:
+        coro.close()
+        stats.record(time.perf_counter() - start, busy, failed)
+
+class HandlerTimer:
+    """
+    Bungkus semua event handler bot sementara untuk mengukur wall time vs busy time:
+    method on_* (@bot.event) dan listener tambahan di bot.extra_events (@bot.listen).
+    """
+    def __init__(self):
+        self.stats: dict[str, HandlerStats] = {}
+        self._saved: dict[str, object] = {}
+        self._saved_listeners: dict[str, list] = {}
+
+    def _wrap(self, name: str, fn):
+        stats = self.stats.setdefault(name, HandlerStats())
+
+        @functools.wraps(fn)
+        async def wrapped(*args, **kwargs):
+            return await _timed_await(fn(*args, **kwargs), stats)
+        return wrapped
+
+    def install(self):
+        for name in dir(bot):
+            if not name.startswith("on_") or name in self._saved:
+                continue
+            fn = getattr(bot, name, None)
+            if asyncio.iscoroutinefunction(fn):
+                self._saved[name] = bot.__dict__.get(name)
+                setattr(bot, name, self._wrap(name, fn))
+        for event, listeners in bot.extra_events.items():
+            if event in self._saved_listeners:
+                continue
+            self._saved_listeners[event] = list(listeners)
+            bot.extra_events[event] = [self._wrap(fn.__name__, fn) for fn in listeners]
+
+    def uninstall(self):
+        for name, original in self._saved.items():
+            if original is None:
+                delattr(bot, name)          # method kelas bawaan
+            else:
+                setattr(bot, name, original)
+        self._saved.clear()
+        for event, listeners in self._saved_listeners.items():
+            bot.extra_events[event] = listeners
+        self._saved_listeners.clear()
+
+    def table(self) -> str:
+        rows = sorted(self.stats.items(), key=lambda kv: kv[1].wall, reverse=True)
+        lines = [f"{'handler':<24}{'calls':>6}{'wall s':>9}{'loop s':>9}{'await s':>9}{'p95 ms':>9}"]
+        for name, st in rows:
+            if not st.calls:
+                continue
+            lines.append(f"{name[:23]:<24}{st.calls:>6}{st.wall:>9.2f}{st.busy:>9.3f}"
+                         f"{st.wall - st.busy:>9.2f}{st.percentile(0.95) * 1000:>9.0f}")
+        return "\n".join(lines)
+
+_profile_lock = asyncio.Lock()
+
+def _profile_report(prof: cProfile.Profile, timer: HandlerTimer, seconds: int) -> str:
+    out = io.StringIO()
+    out.write(f"Profil {seconds}s @ {now_wib().strftime('%Y-%m-%d %H:%M:%S WIB')}\n")
+    out.write(f"loop lag ewma {loop_lag.ewma_ms:.0f}ms, level {loop_lag.level}\n\n")
+    out.write("== Event handler (wall = total, loop = jalan di event loop, await = menunggu I/O) ==\n")
+    out.write(timer.table() + "\n\n")
+    stats = pstats.Stats(prof, stream=out)
+    stats.strip_dirs()
+    out.write("== Fungsi teratas menurut tottime ==\n")
+    stats.sort_stats("tottime").print_stats(30)
+    out.write("== Fungsi teratas menurut cumulative ==\n")
+    stats.sort_stats("cumulative").print_stats(40)
+    return out.getvalue()
+
+@bot.command(name="profile")
+@commands.has_permissions(administrator=True)
+async def profile_cmd(ctx: commands.Context, seconds: int = 15):
+    """!profile <detik>  → cProfile + breakdown per handler selama jendela waktu tsb (maks 120 dtk)"""
+    if ctx.guild is None or ctx.channel.id != guild_cfg(ctx.guild.id).logs_channel:
+        return await ctx.send("Perintah ini hanya di channel moderator/log.", delete_after=8)
+    if _profile_lock.locked():
+        return await ctx.send("⏳ Profiling lain sedang berjalan.", delete_after=8)
+    seconds = max(1, min(PROFILE_MAX_SECONDS, seconds))
+
+    async with _profile_lock:
+        await ctx.send(f"🔬 Profiling {seconds} detik…", delete_after=seconds + 5)
+        timer = HandlerTimer()
+        prof = cProfile.Profile()
+        timer.install()
+        try:
+            prof.enable()
+            await asyncio.sleep(seconds)
+        except ValueError as e:       # profiler lain sudah aktif di thread ini
+            return await ctx.send(f"⚠️ Gagal profiling: {e}", delete_after=10)
+        finally:
+            prof.disable()
+            timer.uninstall()
+
+    report = _profile_report(prof, timer, seconds)
+    prof.create_stats()
+    stamp = now_wib().strftime("%Y%m%d-%H%M%S")
+    files = [
+        discord.File(io.BytesIO(report.encode("utf-8")), f"profile-{stamp}.txt"),
+        discord.File(io.BytesIO(marshal.dumps(prof.stats)), f"profile-{stamp}.prof"),
+    ]
+    summary = timer.table()
+    if len(summary) > 1800:
+        summary = summary[:1800] + "\n…"
+    await ctx.send(f"📊 Hasil profiling {seconds}s (detail di lampiran, `.prof` bisa dibuka dengan snakeviz/pstats):\n"
+                   f"```\n{summary}\n```", files=files)
+
+# ---------- ANNOUNCE (dari moderator/log ke banyak channel / guild, bisa dijadwalkan) ----------
+ANNOUNCE_MAX_ATTACHMENTS = 4
+ANNOUNCE_GRACE_SECONDS   = 3600   # jadwal yang terlewat (bot mati) masih dikirim kalau telat < 1 jam
+
+_announce_tasks: dict[str, asyncio.Task] = {}
+_announce_pending: dict[str, dict] = {}     # doc_id → data jadwal (untuk snapshot)
+
+def _parse_quoted_flag(text: str, flag: str) -> tuple[Optional[str], str]:
+    m = re.search(rf'--{flag}\s+"([^"]+)"', text) or re.search(rf"--{flag}\s+'([^']+)'", text)
+    if not m:
+        return None, text
+    return m.group(1), text[:m.start()] + text[m.end():]
+
+async def _resolve_announce_targets(ctx: commands.Context, spec: str) -> tuple[List[int], List[str]]:
+    """
+    spec kosong → spotlight guild ini; "all" → spotlight semua guild; "<#id> <#id>" → channel tsb.
+    Channel di guild lain hanya boleh kalau author juga punya Manage Server di sana.
+    """
+    if not spec:
+        channels = [ctx.guild.get_channel(guild_cfg(ctx.guild.id).spotlight_channel)]
+    elif spec.strip().lower() == "all":
+        channels = [g.get_channel(guild_cfg(g.id).spotlight_channel) for g in bot.guilds]
+    else:
+        channels = [bot.get_channel(int(cid)) for cid in re.findall(r"<#(\d+)>", spec)]
+
+    target_ids: List[int] = []
+    rejected: List[str] = []
+    for ch in channels:
+        if not isinstance(ch, discord.TextChannel) or ch.id in target_ids:
+            continue
+        if ch.guild.id != ctx.guild.id:
+            member = await _safe_get_member(ch.guild, ctx.author.id)
+            if not member or not member.guild_permissions.manage_guild:
+                rejected.append(f"#{ch.name} ({ch.guild.name}): tidak ada izin")
+                continue
+        target_ids.append(ch.id)
+    return target_ids, rejected
+
+async def _fresh_attachments(dat: dict) -> List[dict]:
+    """URL CDN Discord punya masa berlaku → ambil ulang dari pesan perintah asli kalau masih ada."""
+    ch = bot.get_channel(int(dat.get("from_channel_id") or 0))
+    if isinstance(ch, discord.TextChannel) and dat.get("source_message_id"):
+        try:
+            src = await ch.fetch_message(int(dat["source_message_id"]))
+            return [{"url": a.url, "filename": a.filename, "content_type": a.content_type or ""}
+                    for a in src.attachments[:ANNOUNCE_MAX_ATTACHMENTS]]
+        except Exception:
+            pass
+    return list(dat.get("attachment_meta") or [])
+
+async def run_announcement(dat: dict) -> List[dict]:
+    """
+    Kirim satu pengumuman ke semua target:
+    - gambar pertama → image embed (pakai URL CDN, tanpa upload ulang),
+    - lampiran lain di-upload SEKALI ke target pertama, target berikutnya memakai URL CDN hasil upload itu,
+    - sisa target dikirim paralel lewat outbox (rate limit per channel tetap berlaku).
+    """
+    body = dat.get("content") or ""
+    footer_val = dat.get("footer")
+    mention_val = dat.get("mention")
+    attachments = await _fresh_attachments(dat)
+
+    embed = discord.Embed(description=body or None, color=discord.Color.gold())
+    if footer_val:
+        embed.set_footer(text=footer_val)
+    image_set = False
+    uploads: List[dict] = []
+    for att in attachments:
+        if not image_set and att.get("content_type", "").lower().startswith("image/"):
+            embed.set_image(url=att["url"])
+            image_set = True
+        else:
+            uploads.append(att)
+    use_embed = embed if (body or image_set) else None
+    content_prefix = mention_val + "\n" if mention_val else ""
+
+    targets = [bot.get_channel(int(cid)) or discord.Object(id=int(cid)) for cid in dat.get("target_ids") or []]
+    results: List[dict] = []
+
+    async def send_to(ch, content: str, files=discord.utils.MISSING) -> tuple[dict, Optional[discord.Message]]:
+        if not isinstance(ch, discord.TextChannel):
+            return {"channel_id": ch.id, "ok": False, "error": "channel tidak ditemukan"}, None
+        try:
+            sent = await outbox.send(ch, content or None, embed=use_embed, files=files, priority=PRIO_HIGH)
+            return {"channel_id": ch.id, "guild_id": ch.guild.id, "ok": True, "message_id": sent.id}, sent
+        except Exception as e:
+            return {"channel_id": ch.id, "guild_id": ch.guild.id, "ok": False, "error": str(e)[:200]}, None
+
+    rest = targets
+    cdn_links = ""
+    if uploads and targets:
+        files = []
+        async with aiohttp.ClientSession() as session:
+            for att in uploads:
+                try:
+                    async with session.get(att["url"], timeout=aiohttp.ClientTimeout(total=60)) as r:
+                        if r.status == 200:
+                            files.append(discord.File(io.BytesIO(await r.read()), att.get("filename") or "file"))
+                except Exception as e:
+                    print("[WARN] announce attachment:", e)
+        first, sent = await send_to(targets[0], content_prefix, files=files or discord.utils.MISSING)
+        results.append(first)
+        rest = targets[1:]
+        if sent and sent.attachments:
+            cdn_links = "\n".join(a.url for a in sent.attachments)
+        else:
+            cdn_links = "\n".join(att["url"] for att in uploads)
+
+    content_rest = "\n".join(x for x in (content_prefix.rstrip("\n"), cdn_links) if x)
+    results += [res for res, _ in await asyncio.gather(*(send_to(ch, content_rest) for ch in rest))]
+    return results
+
+def _format_announce_report(results: List[dict], rejected: List[str]) -> str:
+    ok = sum(1 for r in results if r["ok"])
+    lines = [f"📣 Pengumuman terkirim ke {ok}/{len(results) + len(rejected)} target."]
+    for r in results:
+        lines.append(f"✅ <#{r['channel_id']}>" if r["ok"] else f"❌ <#{r['channel_id']}>: {r['error']}")
+    lines += [f"❌ {x}" for x in rejected]
+    return "\n".join(lines)[:1900]
+
+def schedule_announcement_from_doc(doc_id: str, dat: dict):
+    async def fire():
+        delay = float(dat["fire_at_epoch"]) - time.time()
+        if delay < -ANNOUNCE_GRACE_SECONDS:
+            update_announcement(doc_id, status="expired")
+            return
+        if delay > 0:
+            await asyncio.sleep(delay)
+        # status bisa sudah berubah (sent/cancelled) sejak jadwal ini dimuat, mis. dari snapshot lama
+        current = await asyncio.to_thread(get_announcement, doc_id)
+        if current is not None and current.get("status") != "scheduled":
+            print(f"[WARN] Jadwal {doc_id} berstatus {current.get('status')!r}, tidak dikirim ulang.")
+            return
+        results = await run_announcement(dat)
+        await asyncio.to_thread(update_announcement, doc_id, status="sent", results=results,
+                                sent_at=now_wib().isoformat())
+        log_ch = bot.get_channel(int(dat.get("from_channel_id") or 0))
+        if isinstance(log_ch, discord.TextChannel):
+            await outbox.send(log_ch, f"⏰ Jadwal `{doc_id}`\n" + _format_announce_report(results, []),
+                              priority=PRIO_NORMAL)
+
+    def forget(_task):
+        _announce_tasks.pop(doc_id, None)
+        _announce_pending.pop(doc_id, None)
+
+    task = asyncio.create_task(fire())
+    _announce_tasks[doc_id] = task
+    _announce_pending[doc_id] = snapshot_safe(dat)
+    task.add_done_callback(forget)
+
+def resume_scheduled_announcements():
+    items = load_scheduled_announcements()
+    if items:
+        print(f"📣 Menjadwalkan ulang {len(items)} pengumuman dari Firestore.")
+    for doc_id, dat in items:
+        if doc_id not in _announce_tasks:
+            schedule_announcement_from_doc(doc_id, dat)
+
 @bot.command(name="announce")
 @commands.has_permissions(manage_guild=True)
 async def announce(ctx: commands.Context, *, text: str = ""):
     """
-    Kirim pengumuman ke channel Server Spotlight.
+    Kirim pengumuman (default ke channel Server Spotlight).
     Pakai dari channel moderator/log saja.
     Opsi:
       --mention @everyone|@here|<@&ROLEID>
       --footer "teks footer"
+      --to #channel1 #channel2 ...   | --to all  (spotlight semua server)
+      --at "besok jam 9 pagi"        (jadwalkan, WIB)
+      --cancel <id jadwal>
     Attachment (gambar) akan di-embed (pertama sebagai image di embed).
     """
-    if ctx.channel.id != CHANNEL_ID_LOGS:
+    if ctx.guild is None or ctx.channel.id != guild_cfg(ctx.guild.id).logs_channel:
         return await ctx.send("Perintah ini hanya di channel moderator/log.", delete_after=8)
 
-    mention_val = None
-    footer_val = None
-
-    # Parse flags
-    m_footer = re.search(r'--footer\s+"([^"]+)"', text) or re.search(r"--footer\s+'([^']+)'", text)
-    if m_footer:
-        footer_val = m_footer.group(1)
-        text = text[:m_footer.start()] + text[m_footer.end():]
+    m_cancel = re.search(r"--cancel\s+(\S+)", text)
+    if m_cancel:
+        doc_id = m_cancel.group(1)
+        doc = await asyncio.to_thread(get_announcement, doc_id)
+        if doc is None:
+            return await ctx.send("⚠️ Gagal membaca jadwal, coba lagi nanti.", delete_after=8)
+        if not doc or int(doc.get("guild_id") or 0) != ctx.guild.id:
+            return await ctx.send(f"Jadwal `{doc_id}` tidak ditemukan di server ini.", delete_after=8)
+        if doc.get("status") != "scheduled":
+            return await ctx.send(f"Jadwal `{doc_id}` tidak dibatalkan (status: {doc.get('status')}).",
+                                  delete_after=8)
+        task = _announce_tasks.get(doc_id)
+        if task:
+            task.cancel()
+        await asyncio.to_thread(update_announcement, doc_id, status="cancelled")
+        return await ctx.send(f"🗑️ Jadwal `{doc_id}` dibatalkan.", delete_after=8)
+
+    footer_val, text = _parse_quoted_flag(text, "footer")
+    at_val, text = _parse_quoted_flag(text, "at")
 
+    mention_val = None
     m_mention = re.search(r"--mention\s+(\S+)", text)
     if m_mention:
         mention_val = m_mention.group(1)
         text = text[:m_mention.start()] + text[m_mention.end():]
 
+    to_spec = ""
+    m_to = re.search(r"--to\s+((?:<#\d+>\s*)+|all\b)", text, re.IGNORECASE)
+    if m_to:
+        to_spec = m_to.group(1)
+        text = text[:m_to.start()] + text[m_to.end():]
+
     body = text.strip()
     if not body and not ctx.message.attachments:
         return await ctx.send("Tolong sertakan isi pengumuman atau lampiran.", delete_after=8)
 
-    dest = bot.get_channel(CHANNEL_ID_SERVER_SPOTLIGHT)
-    if not isinstance(dest, discord.TextChannel):
-        return await ctx.send("Channel Server Spotlight tidak ditemukan.", delete_after=8)
-
-    embed = discord.Embed(description=body or discord.Embed.Empty, color=discord.Color.gold())
-    if footer_val:
-        embed.set_footer(text=footer_val)
-
-    image_set = False
-    files_to_send = []
-    for att in ctx.message.attachments[:4]:
-        if not image_set and (att.content_type or "").lower().startswith("image/"):
-            embed.set_image(url=att.url)
-            image_set = True
-        else:
-            try:
-                f = await att.to_file()
-                files_to_send.append(f)
-            except Exception:
-                pass
-
-    content_prefix = mention_val + "\n" if mention_val else None
-    sent = await dest.send(content=content_prefix, embed=embed if (body or image_set) else None, files=files_to_send or None)
+    target_ids, rejected = await _resolve_announce_targets(ctx, to_spec)
+    if not target_ids:
+        return await ctx.send("Tidak ada channel tujuan yang valid.\n" + "\n".join(rejected), delete_after=10)
 
-    # Log di Firestore
-    log_announcement({
+    dat = {
         "guild_id": ctx.guild.id,
         "from_channel_id": ctx.channel.id,
-        "to_channel_id": dest.id,
+        "source_message_id": ctx.message.id,
         "author_id": ctx.author.id,
-        "message_id": sent.id,
+        "target_ids": target_ids,
         "content": body,
         "footer": footer_val,
         "mention": mention_val,
-        "attachments": [a.url for a in ctx.message.attachments] if ctx.message.attachments else [],
-    })
+        "attachment_meta": [{"url": a.url, "filename": a.filename, "content_type": a.content_type or ""}
+                            for a in ctx.message.attachments[:ANNOUNCE_MAX_ATTACHMENTS]],
+    }
 
-    await ctx.send("✅ Pengumuman terkirim ke Server Spotlight.", delete_after=8)
+    if at_val:
+        fire_at, when_str = parse_natural_time(at_val, now_wib())
+        dat["fire_at_epoch"] = to_epoch(fire_at)
+        dat["fire_at_wib"] = fire_at.strftime("%Y-%m-%d %H:%M:%S WIB")
+        doc_id = await asyncio.to_thread(save_scheduled_announcement, dat)
+        if not doc_id:
+            return await ctx.send("⚠️ Gagal menyimpan jadwal.", delete_after=8)
+        schedule_announcement_from_doc(doc_id, dat)
+        extra = ("\n" + "\n".join(f"❌ {x}" for x in rejected)) if rejected else ""
+        return await ctx.send(f"🗓️ Pengumuman dijadwalkan `{doc_id}` → {dat['fire_at_wib']} "
+                              f"ke {len(target_ids)} channel.{extra}")
+
+    results = await run_announcement(dat)
+    # Log di Firestore (di thread terpisah supaya event loop tidak tertahan)
+    asyncio.create_task(asyncio.to_thread(log_announcement, {**dat, "status": "sent", "results": results}))
+    await ctx.send(_format_announce_report(results, rejected), delete_after=30)
 
 # ---------- MABAR ----------
+_pending_mabar: dict[str, dict] = {}    # doc_id → data reminder yang masih terjadwal
+
 async def schedule_mabar_tasks_from_doc(doc_id: str, dat: dict):
+    if doc_id in _pending_mabar:
+        return
     try:
         remind_at_epoch = float(dat["remind_at_epoch"])
         channel_id      = int(dat["channel_id"])
         map_name        = str(dat["map_name"])
-        role_id         = int(dat.get("role_id", ROLE_ID_LIGHT))
+        role_id         = int(dat.get("role_id") or guild_cfg(int(dat.get("guild_id", 0))).light_role)
         announce_msg_id = int(dat.get("announce_message_id", 0))
     except Exception as e:
         print("[WARN] Dokumen mabar invalid:", e, dat)
@@ -827,14 +2739,26 @@ async def schedule_mabar_tasks_from_doc(doc_id: str, dat: dict):
         return
 
     role_mention = f"<@&{role_id}>"
+    _pending_mabar[doc_id] = snapshot_safe(dat)
 
     async def remind_task():
+        if _pending_mabar[doc_id].get("status", "scheduled") != "scheduled":
+            return      # sudah diingatkan sebelum restart
         delay = max(0, (remind_at_dt - now_wib()).total_seconds())
         if delay > 60:
             await asyncio.sleep(delay)
+        # snapshot bisa lebih lama dari Firestore (crash setelah reminder terkirim)
+        status = await asyncio.to_thread(get_mabar_status, doc_id)
+        if status is not None and status != "scheduled":
+            if doc_id in _pending_mabar:
+                _pending_mabar[doc_id]["status"] = status or "missing"
+            return
         try:
-            await ch.send(f"{role_mention}\n⏰ Waktunya mabar **{map_name.title()}**! Siap-siap yuk 🎮")
+            await outbox.send(ch, f"{role_mention}\n⏰ Waktunya mabar **{map_name.title()}**! Siap-siap yuk 🎮",
+                              priority=PRIO_HIGH)
             update_mabar_status(doc_id, status="reminded")
+            if doc_id in _pending_mabar:
+                _pending_mabar[doc_id]["status"] = "reminded"
         except Exception as e:
             print("[ERROR] Reminder gagal:", e)
 
@@ -848,6 +2772,7 @@ async def schedule_mabar_tasks_from_doc(doc_id: str, dat: dict):
             except Exception:
                 pass
         update_mabar_status(doc_id, status="done")
+        _pending_mabar.pop(doc_id, None)
 
     asyncio.create_task(remind_task())
     asyncio.create_task(autodelete_task())
@@ -865,7 +2790,8 @@ async def on_message_without_prefix(message: discord.Message):
     pass  # placeholder (kamu bisa mempertahankan versi deteksi natural bila perlu)
 
 async def handle_mabar_message(ctx: commands.Context, text: str):
-    role_light = ctx.guild.get_role(ROLE_ID_LIGHT) if ctx.guild else None
+    cfg = guild_cfg(ctx.guild.id if ctx.guild else None)
+    role_light = ctx.guild.get_role(cfg.light_role) if ctx.guild else None
     if not role_light:
         return await ctx.send("⚠️ Role Light belum diset di kode.")
     if role_light not in ctx.author.roles:
@@ -899,7 +2825,7 @@ async def handle_mabar_message(ctx: commands.Context, text: str):
         description=(
             f"Game / Map: **{map_name.title() or 'Tidak disebut'}**\n"
             f"Waktu: **{when_str}**\n\n"
-            f"Kirim pengumuman ke <#{CHANNEL_ID_MABAR}>?"
+            f"Kirim pengumuman ke <#{cfg.mabar_channel}>?"
         ),
         color=discord.Color.purple()
     )
@@ -930,7 +2856,7 @@ async def handle_mabar_message(ctx: commands.Context, text: str):
     except Exception:
         pass
 
-    mabar_channel = bot.get_channel(CHANNEL_ID_MABAR)
+    mabar_channel = ctx.guild.get_channel(cfg.mabar_channel)
     if not isinstance(mabar_channel, discord.TextChannel):
         return await ctx.send("❌ Channel mabar tidak ditemukan.")
 
@@ -938,15 +2864,15 @@ async def handle_mabar_message(ctx: commands.Context, text: str):
         f"{role_light.mention}\n"
         f"🎮 Yuk mabar **{map_name.title()}** jam **{when_str}**!"
     )
-    announce_msg = await mabar_channel.send(announce_text)
-    await ctx.send(f"✅ Pengumuman mabar dikirim ke <#{CHANNEL_ID_MABAR}>", delete_after=5)
+    announce_msg = await outbox.send(mabar_channel, announce_text, priority=PRIO_HIGH)
+    await ctx.send(f"✅ Pengumuman mabar dikirim ke <#{cfg.mabar_channel}>", delete_after=5)
 
     doc_id = f"{ctx.guild.id}-{announce_msg.id}"
     data = {
         "status": "scheduled",
         "guild_id": ctx.guild.id,
-        "channel_id": CHANNEL_ID_MABAR,
-        "role_id": ROLE_ID_LIGHT,
+        "channel_id": cfg.mabar_channel,
+        "role_id": cfg.light_role,
         "map_name": map_name,
         "announce_message_id": announce_msg.id,
         "created_by_id": ctx.author.id,
@@ -957,6 +2883,199 @@ async def handle_mabar_message(ctx: commands.Context, text: str):
     save_mabar_schedule(doc_id, data)
     await schedule_mabar_tasks_from_doc(doc_id, data)
 
+# =========================
+# WARM-RESTART SNAPSHOT
+# =========================
+STATE_SNAPSHOT_PATH = os.getenv("STATE_SNAPSHOT_PATH", "state_snapshot.json")
+SNAPSHOT_VERSION    = 3
+SNAPSHOT_INTERVAL   = 300                 # detik antar snapshot berkala
+SNAPSHOT_MAX_AGE    = 7 * 24 * 3600       # snapshot lebih tua dari ini diabaikan → full scan
+
+def warn_ephemeral_snapshot():
+    """Default path ada di working directory; di dyno Heroku (Procfile) disk itu hilang tiap restart."""
+    if os.getenv("STATE_SNAPSHOT_PATH"):
+        return
+    where = "dyno Heroku (disk ephemeral)" if os.getenv("DYNO") else "working directory"
+    print(f"[WARN] STATE_SNAPSHOT_PATH tidak diset → snapshot ditulis ke {where}: {os.path.abspath(STATE_SNAPSHOT_PATH)}. "
+          f"Warm restart hanya berguna kalau path ini ada di storage persisten.")
+
+def snapshot_safe(dat: dict) -> dict:
+    """Salinan doc yang bisa di-JSON: buang nilai non-JSON (mis. created_at berupa datetime dari Firestore)."""
+    def ok(v) -> bool:
+        if isinstance(v, (list, tuple)):
+            return all(ok(x) for x in v)
+        if isinstance(v, dict):
+            return all(isinstance(k, str) and ok(x) for k, x in v.items())
+        return v is None or isinstance(v, (str, int, float, bool))
+    return {k: v for k, v in dat.items() if ok(v)}
+
+def build_snapshot() -> dict:
+    return {
+        "version": SNAPSHOT_VERSION,
+        "written_at": time.time(),
+        "legacy_downloader": {k: v for k, v in _legacy_downloader.items() if isinstance(v, (str, int, float, bool))},
+        "guild_configs": {str(gid): cfg.to_doc() for gid, cfg in _guild_configs.items() if gid},
+        "reaction_menus": [[b.guild_id, b.channel_id, b.message_id, b.emoji, b.role_id]
+                           for b in _reaction_roles.values() if b.owner_id is None],
+        "welcome": [[gid, uid, b.channel_id, b.message_id, _welcome_created.get((gid, uid), time.time())]
+                    for (gid, uid), b in _welcome_by_member.items()],
+        "threads": [[gid, uid, tid] for (gid, uid), tid in _dl_threads.items()],
+        "mabar": dict(_pending_mabar),
+        "announcements": dict(_announce_pending),
+        "notices": {str(gid): [mid, on] for gid, (mid, on) in _notice_rendered.items()},
+        "media_forwards": media_index.dump(),
+    }
+
+def _write_snapshot_text(text: str):
+    tmp = STATE_SNAPSHOT_PATH + ".tmp"
+    with open(tmp, "w", encoding="utf-8") as f:
+        f.write(text)
+    os.replace(tmp, STATE_SNAPSHOT_PATH)
+
+_snapshot_failing = False
+
+async def report_snapshot_error(e: Exception):
+    """Snapshot gagal = warm restart berikutnya memakai state lama → kabari channel log (sekali per rentetan gagal)."""
+    global _snapshot_failing
+    print(f"[ERROR] snapshot gagal ditulis: {e.__class__.__name__}: {e}")
+    if _snapshot_failing:
+        return
+    _snapshot_failing = True
+    log_ch = bot.get_channel(CHANNEL_ID_LOGS)
+    if isinstance(log_ch, discord.TextChannel):
+        try:
+            await outbox.send(log_ch, f"⚠️ Snapshot state gagal ditulis (`{e.__class__.__name__}: {e}`). "
+                                      f"Restart berikutnya akan memuat ulang dari Firestore.", priority=PRIO_HIGH)
+        except Exception as send_err:
+            print("[WARN] report_snapshot_error:", send_err)
+
+def snapshot_written():
+    global _snapshot_failing
+    _snapshot_failing = False
+
+def write_snapshot() -> Optional[Exception]:
+    try:
+        _write_snapshot_text(json.dumps(build_snapshot(), ensure_ascii=False))
+    except Exception as e:
+        return e
+    snapshot_written()
+    return None
+
+def load_snapshot() -> Optional[dict]:
+    t0 = time.perf_counter()
+    try:
+        with open(STATE_SNAPSHOT_PATH, encoding="utf-8") as f:
+            snap = json.load(f)
+    except FileNotFoundError:
+        return None
+    except Exception as e:
+        print("[WARN] load_snapshot:", e)
+        return None
+    if snap.get("version") != SNAPSHOT_VERSION:
+        print(f"[WARN] Snapshot versi {snap.get('version')} ≠ {SNAPSHOT_VERSION}, diabaikan.")
+        return None
+    if time.time() - float(snap.get("written_at", 0)) > SNAPSHOT_MAX_AGE:
+        print("[WARN] Snapshot terlalu lama, diabaikan.")
+        return None
+    print(f"💾 Snapshot dimuat dalam {(time.perf_counter() - t0) * 1000:.1f}ms.")
+    return snap
+
+def restore_from_snapshot(snap: dict):
+    _legacy_downloader.clear()
+    _legacy_downloader.update(snap.get("legacy_downloader") or {})
+    for gid, data in (snap.get("guild_configs") or {}).items():
+        apply_guild_config(int(gid), data)
+    for guild_id, channel_id, message_id, emoji, role_id in snap.get("reaction_menus") or []:
+        register_binding(ReactionBinding(guild_id, channel_id, message_id, emoji, role_id))
+    for guild_id, user_id, channel_id, message_id, created_at in snap.get("welcome") or []:
+        register_welcome_binding(guild_id, channel_id, message_id, user_id)
+        schedule_welcome_autodelete(guild_id, user_id, channel_id, message_id, created_at)
+    now = time.time()
+    for guild_id, user_id, thread_id in snap.get("threads") or []:
+        _dl_threads[(guild_id, user_id)] = thread_id
+        _dl_thread_activity[thread_id] = now
+    for doc_id, dat in (snap.get("mabar") or {}).items():
+        asyncio.create_task(schedule_mabar_tasks_from_doc(doc_id, dat))
+    for doc_id, dat in (snap.get("announcements") or {}).items():
+        schedule_announcement_from_doc(doc_id, dat)
+    for gid, (mid, on) in (snap.get("notices") or {}).items():
+        _notice_rendered[int(gid)] = (mid, on)
+    for guild_id, key, channel_id, message_id in snap.get("media_forwards") or []:
+        media_index.put(guild_id, key, channel_id, message_id)
+    print(f"♻️ State dipulihkan: {len(_guild_configs)} guild, {len(_reaction_roles)} binding, "
+          f"{len(_dl_threads)} thread, {len(_pending_mabar)} reminder, {len(_announce_pending)} jadwal pengumuman.")
+
+async def reconcile_with_storage(since_epoch: float):
+    """
+    Ambil hanya perubahan sejak snapshot ditulis (mis. crash sebelum snapshot berikutnya).
+    Menu reaction-role dibaca ulang penuh karena query incremental tidak melihat doc yang dihapus.
+    Konfig guild sudah ditangani listener on_snapshot.
+    """
+    t0 = time.perf_counter()
+    since_dt = datetime.fromtimestamp(since_epoch, tz=timezone.utc)
+    since_iso = from_epoch_to_wib(since_epoch).isoformat()
+
+    legacy = await asyncio.to_thread(get_downloader_config)
+    _legacy_downloader.clear()
+    _legacy_downloader.update(legacy)
+
+    n = 0
+    for doc_id, dat in await asyncio.to_thread(load_changed_since, MABAR_COL, "created_at", since_dt):
+        if dat.get("status") == "scheduled" and "remind_at_epoch" in dat and doc_id not in _pending_mabar:
+            if dat["remind_at_epoch"] + 5400 > time.time():
+                asyncio.create_task(schedule_mabar_tasks_from_doc(doc_id, dat))
+                n += 1
+    for doc_id, dat in await asyncio.to_thread(load_changed_since, WELCOME_COL, "created_at", since_dt):
+        if welcome_doc_key(doc_id, dat) not in _welcome_by_member:
+            register_welcome_from_doc(doc_id, dat)
+            n += 1
+    for doc_id, dat in await asyncio.to_thread(load_changed_since, ANNOUNCE_COL, "created_at", since_dt):
+        if dat.get("status") == "scheduled" and "fire_at_epoch" in dat and doc_id not in _announce_tasks:
+            schedule_announcement_from_doc(doc_id, dat)
+            n += 1
+    # menu reaction-role: koleksi kecil → baca ulang semuanya supaya penghapusan (!rr remove) juga terlihat
+    menus = await asyncio.to_thread(load_reaction_menus)
+    if menus is not None:
+        n += sync_reaction_menus(menus)
+    for _, dat in await asyncio.to_thread(load_changed_since, DL_THREAD_COL, "updated", since_iso):
+        key = (int(dat["guild_id"]), int(dat["user_id"]))
+        if _dl_threads.get(key) != int(dat["thread_id"]):
+            _dl_threads[key] = int(dat["thread_id"])
+            touch_thread(int(dat["thread_id"]))
+            n += 1
+    for _, dat in await asyncio.to_thread(load_changed_since, MEDIA_FWD_COL, "updated", since_iso):
+        if media_index.get(int(dat["guild_id"]), dat["key"]) is None:
+            media_index.put(int(dat["guild_id"]), dat["key"], int(dat["channel_id"]), int(dat["message_id"]))
+            n += 1
+    print(f"🔄 Rekonsiliasi Firestore selesai: {n} perubahan dalam {time.perf_counter() - t0:.1f}s.")
+
+async def snapshot_loop():
+    while not bot.is_closed():
+        await asyncio.sleep(SNAPSHOT_INTERVAL)
+        try:
+            text = json.dumps(build_snapshot(), ensure_ascii=False)
+            await asyncio.to_thread(_write_snapshot_text, text)
+        except Exception as e:
+            await report_snapshot_error(e)
+        else:
+            snapshot_written()
+
+async def graceful_shutdown():
+    print("🛑 SIGTERM diterima, menyimpan snapshot…")
+    err = write_snapshot()
+    if err:
+        await report_snapshot_error(err)
+    if recorder:
+        await recorder.flush()
+    await media_downloader.close()
+    await bot.close()
+
+def install_shutdown_handler(loop: asyncio.AbstractEventLoop):
+    try:
+        loop.add_signal_handler(signal.SIGTERM, lambda: loop.create_task(graceful_shutdown()))
+    except (NotImplementedError, RuntimeError):
+        pass    # Windows / bukan main thread
+
 # =========================
 # RUN
 # =========================
@@ -0,0 +1,449 @@
+# replay_load.py
+"""
+Replay rekaman event gateway (EVENT_RECORD_PATH di main_bot.py) lewat handler asli bot,
+dengan REST Discord, HTTP downloader, dan Firestore yang di-stub di memori.
+
+    python replay_load.py rekaman.jsonl --speed 20
+    python replay_load.py rekaman.jsonl --speed 100 --rest-latency-ms 80 --drain 10
+
+Hasil: persentil latency per handler, jumlah panggilan REST per route,
+operasi storage, lag event loop, dan pertumbuhan memori selama replay.
+
+Catatan: prompt yang menunggu reaksi (forward foto, konfirmasi mabar) akan timeout
+karena ID pesan hasil stub tidak sama dengan ID di rekaman.
+"""
+import os
+import re
+import sys
+import json
+import time
+import types
+import random
+import asyncio
+import tempfile
+import argparse
+import itertools
+import tracemalloc
+from collections import Counter
+from datetime import datetime, timezone
+
+# =========================
+# STUB FIRESTORE (harus terpasang sebelum import main_bot)
+# =========================
+storage_ops: Counter = Counter()
+SERVER_TIMESTAMP = object()
+
+class _Snapshot:
+    def __init__(self, doc_id: str, data):
+        self.id = doc_id
+        self.exists = data is not None
+        self._data = data
+
+    def to_dict(self):
+        return dict(self._data) if self._data is not None else None
+
+class _DocRef:
+    def __init__(self, store: dict, doc_id: str):
+        self._store = store
+        self.id = doc_id
+
+    def get(self):
+        storage_ops["get"] += 1
+        return _Snapshot(self.id, self._store.get(self.id))
+
+    def set(self, data: dict, merge: bool = False):
+        storage_ops["set"] += 1
+        clean = {k: (time.time() if v is SERVER_TIMESTAMP else v) for k, v in data.items()}
+        if merge and self.id in self._store:
+            self._store[self.id].update(clean)
+        else:
+            self._store[self.id] = clean
+
+    def update(self, fields: dict):
+        storage_ops["update"] += 1
+        self._store.setdefault(self.id, {}).update(fields)
+
+    def delete(self):
+        storage_ops["delete"] += 1
+        self._store.pop(self.id, None)
+
+class _Query:
+    _OPS = {
+        "==": lambda a, b: a == b,
+        ">": lambda a, b: a is not None and a > b,
+        ">=": lambda a, b: a is not None and a >= b,
+        "<": lambda a, b: a is not None and a < b,
+    }
+
+    def __init__(self, store: dict, filters=()):
+        self._store = store
+        self._filters = filters
+
+    def where(self, field: str, op: str, value):
+        return _Query(self._store, self._filters + ((field, self._OPS[op], value),))
+
+    def stream(self):
+        storage_ops["stream"] += 1
+        for doc_id, data in list(self._store.items()):
+            if all(fn(data.get(field), value) for field, fn, value in self._filters):
+                yield _Snapshot(doc_id, data)
+
+class _Collection(_Query):
+    _ids = itertools.count(1)
+
+    def __init__(self, store: dict):
+        super().__init__(store)
+
+    def document(self, doc_id=None):
+        return _DocRef(self._store, str(doc_id) if doc_id is not None else f"auto{next(self._ids)}")
+
+    def add(self, data: dict):
+        ref = self.document()
+        ref.set(data)
+        return time.time(), ref
+
+    def on_snapshot(self, _callback):
+        return types.SimpleNamespace(unsubscribe=lambda: None)
+
+class _Batch:
+    def __init__(self):
+        self._ops = []
+
+    def set(self, ref: _DocRef, data: dict):
+        self._ops.append(lambda: ref.set(data))
+
+    def delete(self, ref: _DocRef):
+        self._ops.append(ref.delete)
+
+    def commit(self):
+        storage_ops["batch"] += 1
+        for op in self._ops:
+            op()
+
+class _FakeDB:
+    def __init__(self):
+        self._collections: dict = {}
+
+    def collection(self, name: str):
+        return _Collection(self._collections.setdefault(name, {}))
+
+    def batch(self):
+        return _Batch()
+
+_fake_db = _FakeDB()
+_firestore = types.ModuleType("firebase_admin.firestore")
+_firestore.SERVER_TIMESTAMP = SERVER_TIMESTAMP
+_firestore.client = lambda *a, **k: _fake_db
+_credentials = types.ModuleType("firebase_admin.credentials")
+_credentials.Certificate = lambda obj: obj
+_firebase = types.ModuleType("firebase_admin")
+_firebase.initialize_app = lambda *a, **k: None
+_firebase.firestore = _firestore
+_firebase.credentials = _credentials
+sys.modules.update({
+    "firebase_admin": _firebase,
+    "firebase_admin.firestore": _firestore,
+    "firebase_admin.credentials": _credentials,
+})
+os.environ.setdefault("FIREBASE_SERVICE_ACCOUNT_JSON", "{}")
+os.environ.setdefault("DISCORD_BOT_TOKEN", "replay")
+os.environ.pop("EVENT_RECORD_PATH", None)      # jangan merekam hasil replay
+# snapshot state replay di folder sementara: jangan baca / timpa snapshot produksi
+os.environ["STATE_SNAPSHOT_PATH"] = os.path.join(tempfile.mkdtemp(prefix="replay-"), "state_snapshot.json")
+
+import discord                      # noqa: E402
+import main_bot as mb               # noqa: E402
+
+bot = mb.bot
+state = bot._connection
+
+# =========================
+# STUB REST DISCORD
+# =========================
+_snowflakes = itertools.count(int(time.time() * 1000 - 1420070400000) << 22)
+BOT_USER = {"id": str(next(_snowflakes)), "username": "replay-bot", "discriminator": "0",
+            "avatar": None, "global_name": None, "bot": True}
+
+rest_calls: Counter = Counter()
+_messages: dict = {}       # message_id → payload
+_threads: dict = {}        # thread_id → payload
+_members: dict = {}        # (guild_id, user_id) → role ids
+
+class _FakeResponse:
+    def __init__(self, status: int, reason: str):
+        self.status = status
+        self.reason = reason
+
+def _iso_now() -> str:
+    return datetime.now(timezone.utc).isoformat()
+
+def user_payload(user_id: int, is_bot: bool = False) -> dict:
+    if user_id == int(BOT_USER["id"]):
+        return BOT_USER
+    return {"id": str(user_id), "username": f"user{user_id % 100000}", "discriminator": "0",
+            "avatar": None, "global_name": None, "bot": is_bot}
+
+def member_payload(guild_id: int, user_id: int) -> dict:
+    return {"user": user_payload(user_id), "roles": [str(r) for r in _members.get((guild_id, user_id), [])],
+            "joined_at": _iso_now(), "deaf": False, "mute": False, "flags": 0}
+
+def message_payload(channel_id: int, guild_id, content: str = "", embeds=None, attachments=None,
+                    author=None, message_id=None) -> dict:
+    return {
+        "id": str(message_id or next(_snowflakes)), "channel_id": str(channel_id),
+        "guild_id": str(guild_id) if guild_id else None,
+        "author": author or BOT_USER, "content": content or "", "timestamp": _iso_now(),
+        "edited_timestamp": None, "tts": False, "mention_everyone": False, "mentions": [],
+        "mention_roles": [], "attachments": attachments or [], "embeds": embeds or [],
+        "pinned": False, "type": 0,
+    }
+
+def _guild_of_channel(channel_id: int):
+    ch = bot.get_channel(channel_id)
+    return getattr(getattr(ch, "guild", None), "id", None)
+
+def _body_of(kwargs: dict) -> dict:
+    if kwargs.get("json") is not None:
+        return kwargs["json"]
+    for field in kwargs.get("form") or []:
+        if field.get("name") == "payload_json":
+            return json.loads(field["value"])
+    return {}
+
+def _not_found():
+    raise discord.NotFound(_FakeResponse(404, "Not Found"), "replay: tidak ada")
+
+async def fake_request(route, *, files=None, form=None, **kwargs):
+    rest_calls[route.key] += 1
+    await asyncio.sleep(REST_LATENCY * random.uniform(0.5, 1.5))
+    ids = [int(x) for x in re.findall(r"/(\d{5,})", route.url)]
+    body = _body_of({**kwargs, "form": form})
+
+    if route.method == "POST" and route.path == "/channels/{channel_id}/messages":
+        attachments = [{"id": str(next(_snowflakes)), "filename": f.filename or "file", "size": 1024,
+                        "url": f"https://cdn.replay.invalid/{f.filename}",
+                        "proxy_url": f"https://media.replay.invalid/{f.filename}"} for f in files or []]
+        msg = message_payload(ids[0], _guild_of_channel(ids[0]), body.get("content"), body.get("embeds"),
+                              attachments)
+        _messages[int(msg["id"])] = msg
+        return msg
+    if route.path == "/channels/{channel_id}/messages/{message_id}":
+        msg = _messages.get(ids[1])
+        if msg is None:
+            _not_found()
+        if route.method == "PATCH":
+            msg.update({k: v for k, v in body.items() if k in ("content", "embeds")})
+        if route.method == "DELETE":
+            _messages.pop(ids[1], None)
+            return None
+        return msg
+    if route.method == "POST" and route.path == "/channels/{channel_id}/threads":
+        thread = thread_payload(next(_snowflakes), ids[0], _guild_of_channel(ids[0]), body.get("name", "thread"))
+        _threads[int(thread["id"])] = thread
+        return thread
+    if route.path == "/channels/{channel_id}":
+        thread = _threads.get(ids[0])
+        if thread is None:
+            _not_found()
+        if route.method == "PATCH":
+            thread["thread_metadata"].update({k: v for k, v in body.items() if k in ("archived", "locked")})
+        return thread
+    if route.method == "GET" and route.path == "/guilds/{guild_id}/members/{user_id}":
+        return member_payload(ids[0], ids[1])
+    return None
+
+def thread_payload(thread_id: int, parent_id: int, guild_id, name: str) -> dict:
+    return {
+        "id": str(thread_id), "guild_id": str(guild_id), "parent_id": str(parent_id), "type": 12,
+        "name": name, "owner_id": BOT_USER["id"], "member_count": 2, "message_count": 0,
+        "rate_limit_per_user": 0,
+        "thread_metadata": {"archived": False, "auto_archive_duration": 1440,
+                            "archive_timestamp": _iso_now(), "locked": False, "invitable": False},
+    }
+
+# =========================
+# STUB HTTP (resolver + CDN)
+# =========================
+async def fake_resolve(link: str):
+    rest_calls["HTTP resolver"] += 1
+    await asyncio.sleep(HTTP_LATENCY * random.uniform(0.5, 2.0))
+    return {"status": "tunnel", "url": "https://cdn.replay.invalid/video.mp4", "filename": "video.mp4"}, None
+
+async def fake_download(url: str, max_bytes: int = 25_000_000):
+    rest_calls["HTTP download"] += 1
+    await asyncio.sleep(HTTP_LATENCY * random.uniform(1.0, 4.0))
+    return b"\0" * 256 * 1024, False
+
+# =========================
+# SETUP STATE GUILD DARI REKAMAN
+# =========================
+def build_guilds(events: list):
+    guild_channels: dict = {}
+    guild_roles: dict = {}
+    thread_parents: dict = {}
+    for ev in events:
+        gid = int(ev["guild_id"])
+        cfg = mb.guild_cfg(gid)
+        guild_channels.setdefault(gid, {getattr(cfg, k) for k in mb.GUILD_CHANNEL_KEYS})
+        guild_roles.setdefault(gid, {getattr(cfg, k) for k in mb.GUILD_ROLE_KEYS})
+        roles = ev.get("author_roles") or ev.get("user_roles") or []
+        guild_roles[gid].update(roles)
+        uid = ev.get("author_id") or ev.get("user_id")
+        if uid:
+            _members[(gid, int(uid))] = roles
+        if ev.get("thread_parent_id"):
+            thread_parents[int(ev["channel_id"])] = (gid, int(ev["thread_parent_id"]))
+            guild_channels[gid].add(int(ev["thread_parent_id"]))
+        elif ev.get("channel_id"):
+            guild_channels[gid].add(int(ev["channel_id"]))
+
+    for gid, channels in guild_channels.items():
+        bot_role = next(_snowflakes)
+        _members[(gid, int(BOT_USER["id"]))] = [bot_role]
+        role = lambda rid, name, perms="0", pos=1: {  # noqa: E731
+            "id": str(rid), "name": name, "permissions": perms, "position": pos, "color": 0,
+            "hoist": False, "managed": False, "mentionable": False}
+        state._add_guild_from_data({
+            "id": str(gid), "name": f"replay-{gid}", "icon": None, "owner_id": BOT_USER["id"],
+            "roles": [role(gid, "@everyone", "0", 0), role(bot_role, "bot", "8", 99)]
+                     + [role(r, f"role-{r}") for r in guild_roles[gid]],
+            "channels": [{"id": str(cid), "type": 0, "name": f"ch-{cid}", "position": i,
+                          "permission_overwrites": [], "guild_id": str(gid)} for i, cid in enumerate(channels)],
+            "members": [member_payload(gid, int(BOT_USER["id"]))],
+            "member_count": len([k for k in _members if k[0] == gid]),
+            "emojis": [], "stickers": [], "features": [], "threads": [], "voice_states": [], "presences": [],
+        })
+    for tid, (gid, parent) in thread_parents.items():
+        thread = thread_payload(tid, parent, gid, f"DL-{tid % 10000}")
+        _threads[tid] = thread
+        state.parsers["THREAD_CREATE"](thread)
+
+def feed(ev: dict):
+    gid = int(ev["guild_id"])
+    kind = ev["type"]
+    if kind == "message":
+        uid = int(ev["author_id"])
+        attachments = [{"id": str(next(_snowflakes)), "filename": a.get("filename") or "file",
+                        "size": a.get("size") or 0, "content_type": a.get("content_type"),
+                        "width": a.get("width"), "height": a.get("height"),
+                        "url": f"https://cdn.replay.invalid/{a.get('filename')}",
+                        "proxy_url": f"https://media.replay.invalid/{a.get('filename')}"}
+                       for a in ev.get("attachments") or []]
+        data = message_payload(int(ev["channel_id"]), gid, ev.get("content"), attachments=attachments,
+                               author=user_payload(uid), message_id=int(ev["message_id"]))
+        data["member"] = {k: v for k, v in member_payload(gid, uid).items() if k != "user"}
+        state.parsers["MESSAGE_CREATE"](data)
+    elif kind == "reaction_add":
+        uid = int(ev["user_id"])
+        state.parsers["MESSAGE_REACTION_ADD"]({
+            "user_id": str(uid), "channel_id": str(ev["channel_id"]), "message_id": str(ev["message_id"]),
+            "guild_id": str(gid), "emoji": {"id": None, "name": ev["emoji"]},
+            "member": member_payload(gid, uid), "type": 0, "burst": False,
+        })
+    elif kind == "member_join":
+        state.parsers["GUILD_MEMBER_ADD"]({**member_payload(gid, int(ev["user_id"])), "guild_id": str(gid)})
+    elif kind == "message_delete":
+        state.parsers["MESSAGE_DELETE"]({"id": str(ev["message_id"]), "channel_id": str(ev["channel_id"]),
+                                         "guild_id": str(gid)})
+
+# =========================
+# MAIN
+# =========================
+REST_LATENCY = 0.05
+HTTP_LATENCY = 0.3
+
+def _fmt_table(timer) -> str:
+    rows = [f"{'handler':<24}{'calls':>7}{'err':>5}{'p50 ms':>9}{'p95 ms':>9}{'p99 ms':>9}{'max ms':>9}{'await %':>9}"]
+    for name, st in sorted(timer.stats.items(), key=lambda kv: kv[1].calls, reverse=True):
+        if not st.calls:
+            continue
+        wait_pct = 100 * (st.wall - st.busy) / st.wall if st.wall else 0
+        rows.append(f"{name[:23]:<24}{st.calls:>7}{st.errors:>5}{st.percentile(0.5) * 1000:>9.1f}"
+                    f"{st.percentile(0.95) * 1000:>9.1f}{st.percentile(0.99) * 1000:>9.1f}"
+                    f"{max(st.samples) * 1000:>9.1f}{wait_pct:>9.0f}")
+    return "\n".join(rows)
+
+async def replay(path: str, speed: float, drain: float):
+    with open(path, encoding="utf-8") as f:
+        events = [json.loads(line) for line in f if line.strip()]
+    if not events:
+        print("Rekaman kosong.")
+        return
+
+    await bot._async_setup_hook()
+    bot.http.request = fake_request
+    mb.link_resolver.resolve = fake_resolve
+    mb.download_bytes = fake_download
+    state.user = discord.ClientUser(state=state, data=BOT_USER)
+    build_guilds(events)
+
+    timer = mb.HandlerTimer()
+    timer.install()
+    bot.dispatch("ready")
+    await asyncio.sleep(0.5)
+
+    tracemalloc.start()
+    snap0 = tracemalloc.take_snapshot()
+    rss0 = mb._rss_mb()
+    lag_peak = 0.0
+    t_start = time.monotonic()
+    base = events[0]["t"]
+    for ev in events:
+        due = (ev["t"] - base) / speed
+        delay = due - (time.monotonic() - t_start)
+        if delay > 0:
+            await asyncio.sleep(delay)
+        feed(ev)
+        lag_peak = max(lag_peak, mb.loop_lag.last_ms)
+    fed_in = time.monotonic() - t_start
+
+    deadline = time.monotonic() + drain
+    while time.monotonic() < deadline:
+        busy = [t for t in asyncio.all_tasks() if t.get_name().startswith("discord.py: ")]
+        if not busy:
+            break
+        lag_peak = max(lag_peak, mb.loop_lag.last_ms)
+        await asyncio.sleep(0.1)
+    in_flight = [t for t in asyncio.all_tasks() if t.get_name().startswith("discord.py: ")]
+
+    snap1 = tracemalloc.take_snapshot()
+    rss1 = mb._rss_mb()
+    timer.uninstall()
+
+    recorded_span = events[-1]["t"] - base
+    print(f"\n== Replay {len(events)} event, rentang rekaman {recorded_span:.1f}s, "
+          f"speed {speed:g}x → {fed_in:.1f}s ==")
+    print(Counter(ev["type"] for ev in events).most_common())
+    print("\n== Latency handler ==")
+    print(_fmt_table(timer))
+    print(f"\nHandler masih berjalan setelah drain {drain:g}s: {len(in_flight)}")
+    print("\n== Panggilan REST / HTTP (stub) ==")
+    for key, n in rest_calls.most_common():
+        print(f"{n:>7}  {key}")
+    print("\n== Operasi storage (stub) ==")
+    for key, n in storage_ops.most_common():
+        print(f"{n:>7}  {key}")
+    print(f"\n== Event loop == lag ewma {mb.loop_lag.ewma_ms:.0f}ms, puncak {lag_peak:.0f}ms, level {mb.loop_lag.level}")
+    growth = sum(s.size_diff for s in snap1.compare_to(snap0, "filename"))
+    print(f"\n== Memori == RSS {rss0:.1f} → {rss1:.1f} MB, tracemalloc +{growth / 1024:.0f} KiB")
+    for stat in snap1.compare_to(snap0, "lineno")[:8]:
+        print("  ", stat)
+
+    for t in in_flight:
+        t.cancel()
+
+def main():
+    global REST_LATENCY, HTTP_LATENCY
+    ap = argparse.ArgumentParser(description="Replay rekaman event gateway ke handler bot (stub REST/HTTP/storage).")
+    ap.add_argument("path", help="file JSONL dari EVENT_RECORD_PATH")
+    ap.add_argument("--speed", type=float, default=10.0, help="percepatan 1-100x (default 10)")
+    ap.add_argument("--rest-latency-ms", type=float, default=50.0, help="latency rata-rata stub REST Discord")
+    ap.add_argument("--http-latency-ms", type=float, default=300.0, help="latency rata-rata stub resolver/CDN")
+    ap.add_argument("--drain", type=float, default=5.0, help="detik menunggu handler selesai setelah event terakhir")
+    args = ap.parse_args()
+    REST_LATENCY = args.rest_latency_ms / 1000
+    HTTP_LATENCY = args.http_latency_ms / 1000
+    asyncio.run(replay(args.path, max(1.0, min(100.0, args.speed)), args.drain))
+
+if __name__ == "__main__":
+    main()
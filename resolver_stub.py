@@ -0,0 +1,171 @@
+# resolver_stub.py
+"""
+Uji perilaku LinkResolver (hedging, failover, circuit breaker) terhadap server resolver
+palsu di localhost, memakai kode resolver asli dari main_bot.py.
+
+    python resolver_stub.py
+    python resolver_stub.py --port 18080
+
+Setiap skenario mencetak ✅/❌; exit code 1 kalau ada yang gagal.
+Firestore & token Discord memakai stub dari replay_load.py (bot tidak login).
+"""
+import sys
+import time
+import asyncio
+import argparse
+from collections import Counter
+
+from aiohttp import web
+
+import replay_load                  # pasang stub Firestore sebelum main_bot di-import
+mb = replay_load.mb
+
+# =========================
+# STUB SERVER RESOLVER
+# =========================
+class StubBackend:
+    """Satu endpoint POST / yang delay & status HTTP-nya bisa diubah di tengah skenario."""
+    def __init__(self, name: str, port: int, delay: float = 0.0, status: int = 200):
+        self.name = name
+        self.port = port
+        self.delay = delay
+        self.status = status
+        self.hits = 0
+        self.runner: web.AppRunner | None = None
+
+    @property
+    def url(self) -> str:
+        return f"http://127.0.0.1:{self.port}/"
+
+    async def handle(self, request: web.Request) -> web.Response:
+        self.hits += 1
+        await request.json()
+        await asyncio.sleep(self.delay)
+        if self.status != 200:
+            return web.json_response({"status": "error"}, status=self.status)
+        return web.json_response({"status": "redirect", "url": f"https://cdn.stub.invalid/{self.name}.mp4"})
+
+    async def start(self):
+        app = web.Application()
+        app.router.add_post("/", self.handle)
+        self.runner = web.AppRunner(app)
+        await self.runner.setup()
+        await web.TCPSite(self.runner, "127.0.0.1", self.port).start()
+
+    async def stop(self):
+        if self.runner:
+            await self.runner.cleanup()
+
+def resolver_for(*stubs: StubBackend, cooldown: float = 0.5) -> "mb.LinkResolver":
+    backends = [mb.ResolverBackend(s.name, s.url, timeout=5.0) for s in stubs]
+    for b in backends:
+        b.breaker.cooldown = cooldown
+    return mb.LinkResolver(backends)
+
+results: Counter = Counter()
+
+def check(label: str, ok: bool, detail: str = ""):
+    results["ok" if ok else "fail"] += 1
+    print(f"{'✅' if ok else '❌'} {label}" + (f" — {detail}" if detail else ""))
+
+# =========================
+# SKENARIO
+# =========================
+async def scenario_hedge(slow: StubBackend, fast: StubBackend):
+    slow.delay, fast.delay = 3.0, 0.1
+    res = resolver_for(slow, fast)
+    res.backends[0].latency_ewma = 0.01     # paksa backend lambat dicoba lebih dulu
+    res.backends[1].latency_ewma = 0.5
+    t0 = time.monotonic()
+    data, err = await res.resolve("https://www.tiktok.com/@stub/video/1")
+    took = time.monotonic() - t0
+    check("hedge: backend cepat menjawab saat backend pertama lambat",
+          data is not None and fast.name in data.get("url", ""), f"{took:.2f}s, err={err}")
+    check("hedge: cadangan baru dikirim setelah hedge_delay", mb.HEDGE_MIN_DELAY <= took < slow.delay, f"{took:.2f}s")
+    check("hedge: request yg kalah tidak dihitung gagal", res.backends[0].breaker.failures == 0)
+    await res._get_client().aclose()
+
+async def scenario_failover(bad: StubBackend, fast: StubBackend):
+    bad.delay, bad.status, fast.delay = 0.0, 500, 0.05
+    res = resolver_for(bad, fast)
+    res.backends[1].latency_ewma = 1.0      # backend rusak dicoba lebih dulu
+    data, err = await res.resolve("https://www.instagram.com/p/stub")
+    check("failover: HTTP 500 langsung pindah ke backend berikutnya",
+          data is not None and res.backends[0].errors == 1, f"err={err}")
+    await res._get_client().aclose()
+
+async def scenario_breaker(bad: StubBackend):
+    bad.delay, bad.status = 0.3, 500
+    res = resolver_for(bad, cooldown=0.5)
+    backend = res.backends[0]
+    for _ in range(mb.BREAKER_FAIL_THRESHOLD):
+        await res.resolve("https://www.tiktok.com/@stub/video/2")
+    check("breaker: open setelah gagal beruntun", backend.breaker.state == "open",
+          f"{backend.breaker.failures} gagal")
+
+    hits = bad.hits
+    data, err = await res.resolve("https://www.tiktok.com/@stub/video/3")
+    check("breaker: open → backend tidak dihubungi", data is None and bad.hits == hits, f"err={err}")
+
+    await asyncio.sleep(0.6)
+    hits = bad.hits
+    await asyncio.gather(*(res.resolve("https://www.tiktok.com/@stub/video/4") for _ in range(5)))
+    check("breaker: half-open hanya meloloskan satu probe", bad.hits == hits + 1,
+          f"{bad.hits - hits} request masuk dari 5")
+    check("breaker: probe gagal → open lagi", backend.breaker.state == "open")
+
+    bad.status, bad.delay = 200, 0.05
+    await asyncio.sleep(0.6)
+    data, _ = await res.resolve("https://www.tiktok.com/@stub/video/5")
+    check("breaker: probe sukses → closed", data is not None and backend.breaker.state == "closed")
+    await res._get_client().aclose()
+
+async def scenario_degrade(a: StubBackend, b: StubBackend):
+    a.delay, a.status, b.delay, b.status = 0.05, 200, 0.3, 200
+    res = resolver_for(a, b)
+    for _ in range(3):                      # pemanasan: a jadi backend tercepat
+        await res.resolve("https://www.tiktok.com/@stub/video/6")
+    warm = res.backends[0].latency_ewma or 0.0
+    check("degrade: setelah pemanasan backend cepat jadi pilihan pertama", res._candidates()[0].name == a.name,
+          f"ewma {warm:.2f}s")
+
+    a.delay = 5.0
+    took = []
+    for _ in range(8):
+        t0 = time.monotonic()
+        await res.resolve("https://www.tiktok.com/@stub/video/7")
+        took.append(time.monotonic() - t0)
+    ewma = res.backends[0].latency_ewma or 0.0
+    check("degrade: estimasi latency naik walau request-nya kalah hedge", ewma > warm * 3,
+          f"{warm:.2f}s → {ewma:.2f}s")
+    check("degrade: backend yg melambat turun dari urutan pertama", res._candidates()[0].name == b.name)
+    check("degrade: resolve kembali cepat (tanpa menunggu hedge)", took[-1] < mb.HEDGE_MIN_DELAY + b.delay,
+          " / ".join(f"{t:.2f}" for t in took))
+    await res._get_client().aclose()
+
+async def run(port: int) -> int:
+    slow = StubBackend("slow", port)
+    fast = StubBackend("fast", port + 1)
+    bad = StubBackend("bad", port + 2)
+    for s in (slow, fast, bad):
+        await s.start()
+    mb.HEDGE_MIN_DELAY = 0.3
+    try:
+        await scenario_hedge(slow, fast)
+        await scenario_failover(bad, fast)
+        await scenario_breaker(bad)
+        await scenario_degrade(fast, slow)
+    finally:
+        for s in (slow, fast, bad):
+            await s.stop()
+    print(f"\n{results['ok']} lolos, {results['fail']} gagal")
+    return 1 if results["fail"] else 0
+
+def main():
+    ap = argparse.ArgumentParser(description="Uji hedging & circuit breaker resolver terhadap server stub lokal.")
+    ap.add_argument("--port", type=int, default=18080, help="port pertama (dipakai 3 port berurutan)")
+    args = ap.parse_args()
+    sys.exit(asyncio.run(run(args.port)))
+
+if __name__ == "__main__":
+    main()